@@ -14,3 +14,10 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'recipe_book.settings')
 
 application = get_asgi_application()
+
+from django.conf import settings  # noqa: E402 (needs the settings module set above)
+
+if settings.FAST_BOOT:
+    # Compile templates and populate the URL resolver now, not on the first request
+    from recipes.fast_boot import warm_up
+    warm_up()
@@ -27,11 +27,33 @@ DEBUG = True
 
 ALLOWED_HOSTS = []
 
+# Addresses allowed to read monitoring endpoints such as /admin/admission/stats/ without logging in
+INTERNAL_IPS = ['127.0.0.1']
+
+
+# Fast cold start (see recipes/fast_boot.py and `python manage.py startup_profile`)
+# For short-lived, autoscaled workers: admin.py modules are only imported when /admin/ is first
+# used, and the WSGI/ASGI entry points pre-compile templates and populate the URL resolver before
+# serving. Off by default, since `manage.py check` then skips the ModelAdmin checks.
+# Enable it per process with the RECIPE_BOOK_FAST_BOOT=1 environment variable.
+FAST_BOOT = os.environ.get('RECIPE_BOOK_FAST_BOOT') == '1'
+# Templates compiled into the cached template loader at startup
+FAST_BOOT_WARM_TEMPLATES = [
+    'base.html',
+    'recipes/recipe_list.html',
+    'recipes/recipe_detail.html',
+    'recipes/recipe_form.html',
+    'recipes/recipe_confirm_delete.html',
+]
+# Paths resolved at startup, importing their views; paths under lazily loaded prefixes
+# (/api/, /admin/) would load those modules as well, so leave them out
+FAST_BOOT_WARM_PATHS = ['/', '/recipes/', '/recipes/1/', '/recipes/add/', '/recipes/1/edit/', '/recipes/1/delete/']
 
 # Application definition
 
 INSTALLED_APPS = [
-    'django.contrib.admin',
+    # SimpleAdminConfig leaves discovering admin.py modules to the first /admin/ request
+    'django.contrib.admin.apps.SimpleAdminConfig' if FAST_BOOT else 'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
     'django.contrib.sessions',
@@ -56,7 +78,28 @@ REST_FRAMEWORK = {
     # 'PAGE_SIZE': 10
 }
 
+# Caching
+# The local-memory cache is per process; with several workers, point 'default' at a shared
+# backend (e.g. django.core.cache.backends.redis.RedisCache) so they share cached entries.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+}
+
+# Serialized API representations of recipes (see recipes/representation_cache.py),
+# used by GET /api/recipes/{id}/ and /api/recipes/batch/
+RECIPE_REPRESENTATION_CACHE = 'default'
+RECIPE_REPRESENTATION_CACHE_TIMEOUT = 24 * 60 * 60
+# Most ids one /api/recipes/batch/ request may ask for
+RECIPE_BATCH_MAX_IDS = 500
+
 MIDDLEWARE = [
+    # First, so the profile covers the rest of the middleware stack as well as the view
+    'recipes.profiling.RequestProfilerMiddleware',
+    # Early, so shed requests cost as little as possible
+    'recipes.admission.AdmissionControlMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -96,6 +139,90 @@ DATABASES = {
     }
 }
 
+# Horizontal sharding of recipes (see recipes/sharding.py)
+# To spread recipes over several SQLite files, define one alias per shard in DATABASES, e.g.
+#     'shard0': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': BASE_DIR / 'shard0.sqlite3'},
+# list them here, run `python manage.py migrate --database=<alias>` for each one and then
+# `python manage.py rebalance_recipe_shards --from default` to move the existing recipes.
+# Empty: no sharding, recipes live in the default database.
+RECIPE_SHARDS = []
+# How many ids a process reserves at a time from the global id sequence
+RECIPE_ID_BLOCK_SIZE = 100
+DATABASE_ROUTERS = ['recipes.sharding.RecipeShardRouter']
+
+# Group commit for writes (see recipes/write_coalescer.py)
+# When True, recipe writes from concurrent requests are queued onto one writer thread per
+# process and committed together, instead of each request fighting for the SQLite write lock.
+WRITE_COALESCING = False
+# How long (seconds) the writer waits for more writes before committing a batch
+WRITE_COALESCING_WINDOW = 0.005
+# Maximum number of writes committed in one transaction
+WRITE_COALESCING_MAX_BATCH = 64
+# How long (seconds) a request waits for its write to commit before failing with a DatabaseError
+WRITE_COALESCING_TIMEOUT = 30
+
+# On-demand request profiling (see recipes/profiling.py, viewer at /admin/profiles/)
+PROFILER_ENABLED = True
+# Requests are profiled when they carry a signed token from `manage.py profile_token`...
+PROFILER_TOKEN_MAX_AGE = 3600  # seconds a token stays valid
+# ...or at random with this probability (0.0 disables sampling)
+PROFILER_SAMPLE_RATE = 0.0
+# 'cprofile' (per-function call counts and timings) or 'sampling' (stack samples for flame graphs)
+PROFILER_MODE = 'cprofile'
+PROFILER_SAMPLING_INTERVAL = 0.001  # seconds between stack samples
+# Stored profiles; the oldest are deleted beyond either limit
+PROFILER_STORAGE_DIR = BASE_DIR / 'profiles'
+PROFILER_MAX_PROFILES = 100
+PROFILER_MAX_BYTES = 50 * 1024 * 1024
+
+# Admission control and load shedding (see recipes/admission.py, counters at /admin/admission/stats/)
+# Needs POSIX file locking, so it can't be enabled on Windows
+ADMISSION_CONTROL_ENABLED = False
+# Shared by all worker processes on the host
+ADMISSION_CONTROL_STATE_FILE = BASE_DIR / 'run' / 'admission.state'
+# Requests admitted at once across all classes; each class may use `global_share` of it
+ADMISSION_CONTROL_GLOBAL_CONCURRENCY = 32
+# Slots held longer than this (seconds) or by a dead process are reclaimed
+ADMISSION_CONTROL_LEASE_TIMEOUT = 60
+# First matching class wins; `pattern` is matched against the path including the query string.
+# Lower priority numbers are protected: they may use all of the global limit and wait longer.
+ADMISSION_CONTROL_CLASSES = [
+    {
+        'name': 'detail',  # Recipe pages and API retrieve: cheap, protected
+        'pattern': r'^/(recipes|api/recipes)/\d+/(\?.*)?$',
+        'methods': ['GET', 'HEAD'],
+        'priority': 0,
+        'max_concurrency': 24,
+        'global_share': 1.0,
+        'max_queue': 64,
+        'max_wait': 2.0,
+    },
+    {
+        'name': 'search',  # Full-scan ?q= search in RecipeListView
+        'pattern': r'^/recipes/\?(.*&)?q=',
+        'methods': ['GET', 'HEAD'],
+        'priority': 1,
+        'max_concurrency': 6,
+        'global_share': 0.5,
+        'rate': 20,  # requests per second...
+        'burst': 40,  # ...with bursts up to this size
+        'max_queue': 12,
+        'max_wait': 0.5,
+    },
+    {
+        'name': 'export',  # Unpaginated GET /api/recipes/
+        'pattern': r'^/api/recipes/(\?.*)?$',
+        'methods': ['GET', 'HEAD'],
+        'priority': 2,
+        'max_concurrency': 2,
+        'global_share': 0.25,
+        'rate': 5,
+        'burst': 10,
+        'max_queue': 4,
+        'max_wait': 0.5,
+    },
+]
+
 # Password validation
 # https://docs.djangoproject.com/en/X.Y/ref/settings/#auth-password-validators
 
@@ -135,10 +262,53 @@ STATICFILES_DIRS = [
 ]
 STATIC_ROOT = BASE_DIR / 'staticfiles' # For production deployment
 
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    # collectstatic writes hashed names (app.3f2a9c.css) plus .gz/.br precompressed variants.
+    # Without DEBUG, a file missing from the manifest is an error instead of falling back to its plain name.
+    'staticfiles': {
+        'BACKEND': 'recipes.storage.CompressedManifestStaticFilesStorage',
+        'OPTIONS': {'manifest_fallback': DEBUG},
+    },
+}
+
 # Media files (User-uploaded content)
 MEDIA_URL = 'media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# File serving (see recipes/serving.py)
+# Serve STATIC_URL/MEDIA_URL from Django itself, also with DEBUG off.
+# Turn these off when nginx/Apache serves the directories directly.
+SERVE_STATIC_FILES = True
+SERVE_MEDIA_FILES = True
+# Cache lifetime (seconds) for files whose names are not content hashes;
+# hashed static names and content-addressed media are always cached as immutable
+STATIC_FILES_MAX_AGE = 60
+MEDIA_FILES_MAX_AGE = 3600
+# Hand media file transfers off to the front-end server:
+# None, 'x-sendfile' (Apache mod_xsendfile, lighttpd) or 'x-accel-redirect' (nginx)
+MEDIA_SENDFILE_BACKEND = None
+# nginx `internal` location that maps to MEDIA_ROOT, used with 'x-accel-redirect'
+MEDIA_ACCEL_REDIRECT_PREFIX = '/protected-media/'
+
+# Resumable chunked image uploads (see /api/uploads/)
+# In-progress uploads are assembled here; keep it outside MEDIA_ROOT (so partial files are never served)
+# but on the same filesystem, so finalized images can be moved into place instead of copied
+CHUNKED_UPLOAD_TEMP_DIR = BASE_DIR / 'upload_tmp'
+# Largest image (in bytes) a chunked upload may declare
+CHUNKED_UPLOAD_MAX_SIZE = 50 * 1024 * 1024
+# Unfinished uploads are purged this many seconds after their last chunk (`python manage.py purge_uploads`)
+CHUNKED_UPLOAD_EXPIRY = 24 * 60 * 60
+
+# Static pre-rendering (see `python manage.py render_static`)
+# Output directory for the pre-rendered list/detail pages and their build manifest
+STATIC_RENDER_ROOT = BASE_DIR / 'prerendered'
+# When True, anonymous GETs of the list/detail pages are answered from STATIC_RENDER_ROOT,
+# falling back to live rendering for searches or pages that have not been rendered yet
+STATIC_RENDER_SERVE = False
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/X.Y/ref/settings/#default-auto-field
 
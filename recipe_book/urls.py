@@ -1,35 +1,39 @@
-from django.contrib import admin
-from django.urls import path, include
+import re
+
+from django.urls import path, include, re_path
 from django.conf import settings
-from django.conf.urls.static import static
 from django.shortcuts import redirect
 
-# Import DRF router
-from rest_framework import routers
-# Import your API ViewSet
-from recipes.api_views import RecipeViewSet
+from recipes.admission_views import admission_stats
+from recipes.fast_boot import lazy_admin_path, lazy_path
+from recipes.serving import serve_media, serve_static
 
 def redirect_to_recipes(request):
     return redirect('recipes:recipe_list')
 
-# Create a router instance
-router = routers.DefaultRouter()
-# Register your ViewSet with the router.
-# The first argument is the URL prefix for this set of API endpoints.
-# The second argument is the ViewSet class.
-router.register(r'recipes', RecipeViewSet) # This will create URLs like /api/recipes/, /api/recipes/{id}/
-
+# The admin, the profile viewer, the API (DRF router, views and viewsets) and the DRF
+# login views are imported on first use of their prefix rather than with this module, so a fresh
+# worker serving recipe pages never loads them (see recipes/fast_boot.py)
 urlpatterns = [
     path('', redirect_to_recipes, name='home'),  # Redirige la ruta raíz a recipes
-    path('admin/', admin.site.urls),
+    lazy_path('admin/profiles/', 'recipes.profiling_urls', 'profiling'), # Staff-only request profile viewer
+    path('admin/admission/stats/', admission_stats, name='admission_stats'), # Load shedding counters (JSON)
+    lazy_admin_path('admin/'),
     path('recipes/', include('recipes.urls')), # Your existing web app URLs
 
     # API URLs
-    path('api/', include(router.urls)), # Include all URLs generated by the router under /api/
+    lazy_path('api/', 'recipes.api_urls', 'api'), # Router URLs (recipes/api_urls.py) under /api/
     # Optional: DRF login/logout views for the browsable API
-    path('api-auth/', include('rest_framework.urls', namespace='rest_framework')),
+    lazy_path('api-auth/', 'rest_framework.urls', 'rest_framework'),
 ]
 
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
-    urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
\ No newline at end of file
+# Static and media files, served with caching, precompression and Range support (see recipes.serving).
+# Works with DEBUG off; set SERVE_*_FILES = False when the front-end server serves them itself.
+if settings.SERVE_MEDIA_FILES:
+    urlpatterns += [
+        re_path(r'^%s(?P<path>.*)$' % re.escape(settings.MEDIA_URL.lstrip('/')), serve_media),
+    ]
+if settings.SERVE_STATIC_FILES:
+    urlpatterns += [
+        re_path(r'^%s(?P<path>.*)$' % re.escape(settings.STATIC_URL.lstrip('/')), serve_static),
+    ]
\ No newline at end of file
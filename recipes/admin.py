@@ -1,5 +1,8 @@
+from itertools import groupby
+
 from django.contrib import admin
 from .models import Recipe
+from .sharding import is_sharding_enabled, pinned_shard
 
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
@@ -45,4 +48,23 @@ class RecipeAdmin(admin.ModelAdmin):
     def has_image(self, obj):
         return bool(obj.image or obj.image_url)
     has_image.boolean = True # Displays a nice checkmark/X icon
-    has_image.short_description = 'Image' # Column header name
\ No newline at end of file
+    has_image.short_description = 'Image' # Column header name
+
+    # With RECIPE_SHARDS set, the change list, search and date drill-down fan out
+    # to every shard through Recipe.objects (see recipes/sharding.py). The deletion
+    # summary is collected by Django without an instance to route by, so it is
+    # built one shard at a time.
+    def get_deleted_objects(self, objs, request):
+        if not is_sharding_enabled():
+            return super().get_deleted_objects(objs, request)
+        to_delete, model_count, perms_needed, protected = [], {}, set(), []
+        by_shard = sorted(objs, key=lambda obj: obj._state.db)
+        for alias, shard_objs in groupby(by_shard, key=lambda obj: obj._state.db):
+            with pinned_shard(alias):
+                shard_result = super().get_deleted_objects(list(shard_objs), request)
+            to_delete += shard_result[0]
+            for name, count in shard_result[1].items():
+                model_count[name] = model_count.get(name, 0) + count
+            perms_needed |= shard_result[2]
+            protected += shard_result[3]
+        return to_delete, model_count, perms_needed, protected
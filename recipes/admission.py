@@ -0,0 +1,413 @@
+# recipes/admission.py
+"""
+Admission control and load shedding.
+
+Requests are sorted into the route classes configured in
+ADMISSION_CONTROL_CLASSES (e.g. cheap "detail" pages vs. expensive "search"
+and "export"). Each class has:
+
+- a concurrency limit (`max_concurrency`) and a share of the global limit
+  (`global_share`), so expensive classes can never occupy all the slots that
+  detail pages and API retrieves need;
+- an optional token-bucket rate limit (`rate` requests/second, `burst`);
+- a bounded wait queue (`max_queue`) with a deadline (`max_wait` seconds).
+
+Requests over the rate limit get an immediate 429, requests that find the
+queue full or wait past the deadline get a 503, both with Retry-After.
+
+The state lives in one small binary file (ADMISSION_CONTROL_STATE_FILE)
+guarded by a POSIX record lock, so all worker processes on the host share the
+same limits without any external service. Slots and queued waiters record the
+owning pid, so those of a crashed worker are reclaimed; each acquire also gets
+its own token, so a slot reclaimed after the lease timeout and handed to
+another thread is not freed by its original holder. POSIX only (fcntl).
+"""
+import hashlib
+import json
+import math
+import os
+import re
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.http import HttpResponse
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# Bump when the layout below changes, so old state files are discarded
+STATE_VERSION = 2
+FINGERPRINT = struct.Struct('<16s')
+# tokens, last_refill, admitted, queued_total, shed_queue_full, shed_timeout, shed_rate
+CLASS_HEADER = struct.Struct('<ddqqqqq')
+COUNTER_NAMES = ('admitted', 'queued_total', 'shed_queue_full', 'shed_timeout', 'shed_rate')
+# pid, acquired_at, token
+SLOT = struct.Struct('<qdq')
+# pid, queued_at, token
+WAITER = struct.Struct('<qdq')
+FREE = (0, 0.0, 0)
+# How long past its deadline a queued waiter must be before it is considered dead
+WAITER_GRACE = 1.0
+
+CLASS_DEFAULTS = {
+    'priority': 0,
+    'methods': None,
+    'max_concurrency': 8,
+    'global_share': 1.0,
+    'rate': None,
+    'burst': None,
+    'max_queue': 16,
+    'max_wait': 1.0,
+    'retry_after': 1,
+}
+
+
+class RouteClass:
+    """
+    One configured admission class.
+    """
+
+    def __init__(self, index, config):
+        options = {**CLASS_DEFAULTS, **config}
+        self.index = index
+        self.name = options['name']
+        self.priority = options['priority']
+        self.pattern = re.compile(options['pattern'])
+        self.methods = {m.upper() for m in options['methods']} if options['methods'] else None
+        self.max_concurrency = options['max_concurrency']
+        self.global_share = options['global_share']
+        self.rate = options['rate']
+        self.burst = options['burst'] or options['rate'] or 0
+        self.max_queue = options['max_queue']
+        self.max_wait = options['max_wait']
+        self.retry_after = options['retry_after']
+
+    def matches(self, request):
+        if self.methods is not None and request.method not in self.methods:
+            return False
+        return bool(self.pattern.search(request.get_full_path()))
+
+
+def pid_is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class AdmissionController:
+    """
+    Shared, file-backed admission state for a list of route classes.
+    """
+
+    def __init__(self, state_file, class_configs, global_concurrency, lease_timeout=60):
+        if fcntl is None:
+            raise ImproperlyConfigured('Admission control needs POSIX file locking (fcntl), which is not available here.')
+        self.state_file = Path(state_file)
+        self.classes = [RouteClass(index, config) for index, config in enumerate(class_configs)]
+        self.global_concurrency = global_concurrency
+        self.lease_timeout = lease_timeout
+        self.fingerprint = hashlib.md5(
+            json.dumps([STATE_VERSION, class_configs, global_concurrency], sort_keys=True, default=str).encode()
+        ).digest()
+        self.size = FINGERPRINT.size + sum(
+            CLASS_HEADER.size + SLOT.size * route_class.max_concurrency + WAITER.size * route_class.max_queue
+            for route_class in self.classes
+        )
+        self._thread_lock = threading.Lock()
+        self._last_token = 0
+        self._fd = None
+        self._fd_pid = None
+
+    def classify(self, request):
+        for route_class in self.classes:
+            if route_class.matches(request):
+                return route_class
+        return None
+
+    # State file handling
+
+    def _get_fd(self):
+        if self._fd is None or self._fd_pid != os.getpid():
+            self.state_file.parent.mkdir(parents=True, exist_ok=True)
+            self._fd = os.open(self.state_file, os.O_RDWR | os.O_CREAT, 0o600)
+            self._fd_pid = os.getpid()
+        return self._fd
+
+    def _decode(self, raw, now):
+        if len(raw) != self.size or FINGERPRINT.unpack_from(raw, 0)[0] != self.fingerprint:
+            # New file or the configuration changed: start from a clean state
+            return [
+                {
+                    'tokens': float(route_class.burst), 'last_refill': now,
+                    **{name: 0 for name in COUNTER_NAMES},
+                    'slots': [FREE] * route_class.max_concurrency,
+                    'waiters': [FREE] * route_class.max_queue,
+                }
+                for route_class in self.classes
+            ]
+        state = []
+        offset = FINGERPRINT.size
+        for route_class in self.classes:
+            tokens, last_refill, *counters = CLASS_HEADER.unpack_from(raw, offset)
+            offset += CLASS_HEADER.size
+            slots = []
+            for _ in range(route_class.max_concurrency):
+                slots.append(SLOT.unpack_from(raw, offset))
+                offset += SLOT.size
+            waiters = []
+            for _ in range(route_class.max_queue):
+                waiters.append(WAITER.unpack_from(raw, offset))
+                offset += WAITER.size
+            state.append({
+                'tokens': tokens, 'last_refill': last_refill,
+                **dict(zip(COUNTER_NAMES, counters)),
+                'slots': slots,
+                'waiters': waiters,
+            })
+        return state
+
+    def _encode(self, state):
+        parts = [FINGERPRINT.pack(self.fingerprint)]
+        for entry in state:
+            parts.append(CLASS_HEADER.pack(
+                entry['tokens'], entry['last_refill'],
+                *(entry[name] for name in COUNTER_NAMES)
+            ))
+            parts.extend(SLOT.pack(*slot) for slot in entry['slots'])
+            parts.extend(WAITER.pack(*waiter) for waiter in entry['waiters'])
+        return b''.join(parts)
+
+    @contextmanager
+    def _locked_state(self):
+        """
+        Yields the decoded state under an exclusive lock and writes it back afterwards.
+        """
+        with self._thread_lock:
+            fd = self._get_fd()
+            fcntl.lockf(fd, fcntl.LOCK_EX)
+            try:
+                now = time.time()
+                state = self._decode(os.pread(fd, self.size, 0), now)
+                yield state, now
+                data = self._encode(state)
+                os.pwrite(fd, data, 0)
+                if os.fstat(fd).st_size != len(data):
+                    os.ftruncate(fd, len(data))
+            finally:
+                fcntl.lockf(fd, fcntl.LOCK_UN)
+
+    # Admission decisions
+
+    def _new_token(self):
+        # Called with the state locked; unique within this process, the pid tells processes apart
+        self._last_token += 1
+        return self._last_token
+
+    def _reclaim(self, state, now):
+        """
+        Frees slots held by dead processes or for longer than the lease timeout,
+        and queue places of waiters that died or are long past their deadline.
+        """
+        for route_class, entry in zip(self.classes, state):
+            entry['slots'] = [
+                slot if not slot[0] or (now - slot[1] < self.lease_timeout and pid_is_alive(slot[0])) else FREE
+                for slot in entry['slots']
+            ]
+            max_age = route_class.max_wait + WAITER_GRACE
+            entry['waiters'] = [
+                waiter if not waiter[0] or (now - waiter[1] < max_age and pid_is_alive(waiter[0])) else FREE
+                for waiter in entry['waiters']
+            ]
+
+    def _try_take_slot(self, state, now, route_class):
+        in_use = sum(1 for entry in state for slot in entry['slots'] if slot[0])
+        if in_use >= math.floor(self.global_concurrency * route_class.global_share):
+            return None
+        slots = state[route_class.index]['slots']
+        for index, slot in enumerate(slots):
+            if not slot[0]:
+                token = self._new_token()
+                slots[index] = (os.getpid(), now, token)
+                return index, token
+        return None
+
+    def _join_queue(self, entry, now):
+        waiters = entry['waiters']
+        for index, waiter in enumerate(waiters):
+            if not waiter[0]:
+                token = self._new_token()
+                waiters[index] = (os.getpid(), now, token)
+                return index, token
+        return None
+
+    def _leave_queue(self, entry, place):
+        index, token = place
+        waiter = entry['waiters'][index]
+        if waiter[0] == os.getpid() and waiter[2] == token:
+            entry['waiters'][index] = FREE
+
+    def take_token(self, route_class):
+        """
+        Token-bucket check. Returns 0 if the request may proceed, otherwise the
+        number of seconds until a token is available.
+        """
+        if not route_class.rate:
+            return 0
+        with self._locked_state() as (state, now):
+            entry = state[route_class.index]
+            elapsed = max(now - entry['last_refill'], 0)
+            entry['tokens'] = min(route_class.burst, entry['tokens'] + elapsed * route_class.rate)
+            entry['last_refill'] = now
+            if entry['tokens'] >= 1:
+                entry['tokens'] -= 1
+                return 0
+            entry['shed_rate'] += 1
+            return (1 - entry['tokens']) / route_class.rate
+
+    def acquire(self, route_class):
+        """
+        Waits (within the class's queue and deadline) for a concurrency slot.
+        Returns a ticket for release(), or None if the request must be shed.
+        """
+        deadline = time.monotonic() + route_class.max_wait
+        poll_interval = 0.005 * (route_class.priority + 1)  # Higher priority classes poll more often
+        place = None
+        try:
+            while True:
+                with self._locked_state() as (state, now):
+                    entry = state[route_class.index]
+                    ticket = self._try_take_slot(state, now, route_class)
+                    if ticket is None and place is None:
+                        self._reclaim(state, now)
+                        ticket = self._try_take_slot(state, now, route_class)
+                    if ticket is not None:
+                        entry['admitted'] += 1
+                        if place is not None:
+                            self._leave_queue(entry, place)
+                            place = None
+                        return ticket
+                    if place is None:
+                        place = self._join_queue(entry, now) if route_class.max_wait > 0 else None
+                        if place is None:
+                            entry['shed_queue_full'] += 1
+                            return None
+                        entry['queued_total'] += 1
+                    elif time.monotonic() >= deadline:
+                        self._leave_queue(entry, place)
+                        place = None
+                        entry['shed_timeout'] += 1
+                        return None
+                time.sleep(min(poll_interval, max(deadline - time.monotonic(), 0)))
+        finally:
+            if place is not None:
+                # Interrupted while queued (e.g. a worker timeout raised in this thread)
+                with self._locked_state() as (state, now):
+                    self._leave_queue(state[route_class.index], place)
+
+    def release(self, route_class, ticket):
+        index, token = ticket
+        with self._locked_state() as (state, now):
+            slots = state[route_class.index]['slots']
+            pid, acquired_at, slot_token = slots[index]
+            # The slot may have been reclaimed after the lease timeout and taken by someone else
+            if pid == os.getpid() and slot_token == token:
+                slots[index] = FREE
+
+    def stats(self):
+        """
+        Current in-flight/queued counts and cumulative counters per class.
+        """
+        with self._locked_state() as (state, now):
+            return {
+                route_class.name: {
+                    'priority': route_class.priority,
+                    'in_flight': sum(1 for slot in entry['slots'] if slot[0]),
+                    'max_concurrency': route_class.max_concurrency,
+                    'queued': sum(1 for waiter in entry['waiters'] if waiter[0]),
+                    **{name: entry[name] for name in COUNTER_NAMES},
+                }
+                for route_class, entry in zip(self.classes, state)
+            }
+
+    def reset(self):
+        with self._locked_state() as (state, now):
+            state[:] = self._decode(b'', now)
+
+
+_controller = None
+_controller_key = None
+_controller_lock = threading.Lock()
+
+
+def get_admission_controller():
+    """
+    Returns the controller for the current settings (rebuilt if they change).
+    """
+    global _controller, _controller_key
+    key = (
+        str(settings.ADMISSION_CONTROL_STATE_FILE),
+        json.dumps(settings.ADMISSION_CONTROL_CLASSES, sort_keys=True, default=str),
+        settings.ADMISSION_CONTROL_GLOBAL_CONCURRENCY,
+        settings.ADMISSION_CONTROL_LEASE_TIMEOUT,
+    )
+    with _controller_lock:
+        if _controller_key != key:
+            _controller = AdmissionController(
+                settings.ADMISSION_CONTROL_STATE_FILE,
+                settings.ADMISSION_CONTROL_CLASSES,
+                settings.ADMISSION_CONTROL_GLOBAL_CONCURRENCY,
+                settings.ADMISSION_CONTROL_LEASE_TIMEOUT,
+            )
+            _controller_key = key
+    return _controller
+
+
+def shed_response(status, retry_after, route_class):
+    response = HttpResponse(
+        'Too many requests, please retry later.\n' if status == 429 else 'Server busy, please retry later.\n',
+        status=status,
+        content_type='text/plain; charset=utf-8',
+    )
+    response['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    response['X-Admission-Class'] = route_class.name
+    return response
+
+
+class AdmissionControlMiddleware:
+    """
+    Applies the configured admission classes to incoming requests.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.ADMISSION_CONTROL_ENABLED:
+            return self.get_response(request)
+        controller = get_admission_controller()
+        route_class = controller.classify(request)
+        if route_class is None:
+            return self.get_response(request)
+
+        wait = controller.take_token(route_class)
+        if wait:
+            return shed_response(429, wait, route_class)
+
+        slot = controller.acquire(route_class)
+        if slot is None:
+            return shed_response(503, route_class.retry_after, route_class)
+        try:
+            return self.get_response(request)
+        finally:
+            controller.release(route_class, slot)
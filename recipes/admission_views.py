@@ -0,0 +1,19 @@
+# recipes/admission_views.py
+from django.conf import settings
+from django.http import HttpResponseForbidden, JsonResponse
+
+from .admission import get_admission_controller
+
+
+def admission_stats(request):
+    """
+    Admission control counters as JSON, for staff users and monitoring agents
+    connecting from INTERNAL_IPS.
+    """
+    is_staff = getattr(getattr(request, 'user', None), 'is_staff', False)
+    if not is_staff and request.META.get('REMOTE_ADDR') not in settings.INTERNAL_IPS:
+        return HttpResponseForbidden()
+    return JsonResponse({
+        'enabled': settings.ADMISSION_CONTROL_ENABLED,
+        'classes': get_admission_controller().stats(),
+    })
@@ -0,0 +1,18 @@
+# recipes/api_urls.py
+# Mounted under /api/ (lazily, see recipe_book/urls.py), so DRF and the API views
+# are only imported when the API is first used.
+from rest_framework import routers
+
+from .api_views import ImageUploadViewSet, RecipeViewSet
+
+app_name = 'api'
+
+# Create a router instance
+router = routers.DefaultRouter()
+# Register your ViewSet with the router.
+# The first argument is the URL prefix for this set of API endpoints.
+# The second argument is the ViewSet class.
+router.register(r'recipes', RecipeViewSet) # This will create URLs like /api/recipes/, /api/recipes/{id}/
+router.register(r'uploads', ImageUploadViewSet) # Resumable chunked image uploads: /api/uploads/, /api/uploads/{id}/chunk/
+
+urlpatterns = router.urls
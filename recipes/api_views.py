@@ -1,7 +1,21 @@
 # recipes/api_views.py
-from rest_framework import viewsets
-from .models import Recipe
-from .serializers import RecipeSerializer
+import os
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, models, transaction
+from django.utils import timezone
+from rest_framework import mixins, serializers, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+from .models import Recipe, RecipeImageUpload
+from .representation_cache import cached_representation, get_cached, serialize_and_cache
+from .serializers import RecipeImageUploadSerializer, RecipeSerializer
+from .sharding import route_to_shard
+from .uploads import ChunkedUploadFile, UploadLocked, discard_upload, upload_lock, validate_image_file, write_chunk
+from .views import DUPLICATE_TITLE_MESSAGE
+from .write_coalescer import run_write
 
 class RecipeViewSet(viewsets.ModelViewSet):
     """
@@ -11,6 +25,118 @@ class RecipeViewSet(viewsets.ModelViewSet):
     queryset = Recipe.objects.all().order_by('title') # Define the base queryset
     serializer_class = RecipeSerializer # Link the serializer to this ViewSet
 
+    def get_queryset(self):
+        """
+        Single-object actions query only the recipe's shard (when RECIPE_SHARDS is set);
+        list fans out to all shards.
+        """
+        queryset = super().get_queryset()
+        return route_to_shard(queryset, self.kwargs.get(self.lookup_url_kwarg or self.lookup_field))
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Returns the recipe, reusing its cached representation while it is unchanged.
+        """
+        instance = self.get_object()
+        return Response(cached_representation(
+            request, instance, self.get_serializer_class(), self.get_serializer_context()
+        ))
+
+    @action(detail=False, methods=['get', 'post'])
+    def batch(self, request):
+        """
+        Returns several recipes in one request, in the order the ids were given.
+
+        GET  /api/recipes/batch/?ids=3,1,7
+        POST /api/recipes/batch/        {"ids": [3, 1, 7]}  (for lists too long for a URL)
+
+        Ids that don't exist are listed under "missing". Representations come
+        from the per-object cache; only the misses are loaded (in one query)
+        and serialized.
+        """
+        try:
+            ids = self._batch_ids(request)
+        except ValueError as exc:
+            return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        versions = dict(queryset.filter(pk__in=ids).order_by().values_list('pk', 'updated_at'))
+        representations = get_cached(request, versions)
+        misses = [pk for pk in versions if pk not in representations]
+        if misses:
+            loaded = queryset.in_bulk(misses)
+            instances = [loaded[pk] for pk in misses if pk in loaded]  # Deleted in between: missing
+            representations.update(serialize_and_cache(
+                request, instances, self.get_serializer_class(), self.get_serializer_context()
+            ))
+
+        return Response({
+            'results': [representations[pk] for pk in ids if pk in representations],
+            'missing': [pk for pk in ids if pk not in representations],
+        })
+
+    def _batch_ids(self, request):
+        """
+        Reads the requested ids (comma-separated and/or repeated `ids` values,
+        or a JSON list), without duplicates and in the given order.
+        """
+        if request.method == 'POST':
+            data = request.data
+            if isinstance(data, list):
+                values = data
+            elif hasattr(data, 'getlist'):
+                values = data.getlist('ids')
+            else:
+                values = data.get('ids', [])
+            if isinstance(values, (str, int)):
+                values = [values]
+        else:
+            values = request.query_params.getlist('ids')
+
+        ids = []
+        for value in values:
+            parts = value.split(',') if isinstance(value, str) else [value]
+            for part in parts:
+                if isinstance(part, str):
+                    part = part.strip()
+                    if not part:
+                        continue
+                try:
+                    if isinstance(part, bool) or not isinstance(part, (int, str)):
+                        raise TypeError
+                    pk = int(part)
+                    # Out of range for the database's integer columns (SQLite raises OverflowError)
+                    if abs(pk) > models.BigIntegerField.MAX_BIGINT:
+                        raise ValueError
+                except (TypeError, ValueError):
+                    raise ValueError(f'Invalid recipe id: {part!r}.')
+                ids.append(pk)
+        ids = list(dict.fromkeys(ids))
+        if not ids:
+            raise ValueError('Provide the recipe ids to fetch, e.g. ?ids=1,2,3.')
+        max_ids = getattr(settings, 'RECIPE_BATCH_MAX_IDS', 500)
+        if len(ids) > max_ids:
+            raise ValueError(f'At most {max_ids} ids can be fetched at once.')
+        return ids
+
+    # Writes go through run_write(), so concurrent API writes are group-committed
+    # when WRITE_COALESCING is enabled
+    def perform_create(self, serializer):
+        self._save(serializer)
+
+    def perform_update(self, serializer):
+        self._save(serializer)
+
+    def perform_destroy(self, instance):
+        run_write(instance.delete)
+
+    def _save(self, serializer):
+        try:
+            run_write(serializer.save)
+        except IntegrityError:
+            # Another request saved the same title between validation and commit
+            raise serializers.ValidationError({'title': [DUPLICATE_TITLE_MESSAGE]})
+
     # Optional: You can customize individual actions if needed
     # def list(self, request, *args, **kwargs):
     #     # Custom logic for listing recipes
@@ -18,4 +144,138 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
     # def create(self, request, *args, **kwargs):
     #     # Custom logic for creating recipes
-    #     return super().create(request, *args, **kwargs)
\ No newline at end of file
+    #     return super().create(request, *args, **kwargs)
+
+class ImageUploadViewSet(mixins.CreateModelMixin,
+                         mixins.RetrieveModelMixin,
+                         mixins.DestroyModelMixin,
+                         viewsets.GenericViewSet):
+    """
+    Resumable chunked upload of recipe images.
+
+    1. POST   /api/uploads/                          {recipe, filename, size} -> upload id
+    2. PUT    /api/uploads/{id}/chunk/?offset=N      raw bytes, repeated until offset == size
+       GET    /api/uploads/{id}/                     current offset, to resume after a failure
+    3. POST   /api/uploads/{id}/finalize/            validates the image and attaches it to the recipe
+       DELETE /api/uploads/{id}/                     abandons the upload
+    """
+    queryset = RecipeImageUpload.objects.all()
+    serializer_class = RecipeImageUploadSerializer
+
+    @action(detail=True, methods=['put'])
+    def chunk(self, request, pk=None):
+        """
+        Appends a chunk at ?offset=N. The body is streamed to disk and never
+        parsed, so request.data must not be touched here.
+        """
+        upload = self.get_object()
+
+        try:
+            offset = int(request.query_params.get('offset', ''))
+        except ValueError:
+            return Response({'detail': 'The offset query parameter is required.'}, status=status.HTTP_400_BAD_REQUEST)
+        if offset != upload.offset:
+            # Client and server disagree; tell the client where to resume from
+            return Response(
+                {'detail': 'Offset does not match the bytes received so far.', 'offset': upload.offset},
+                status=status.HTTP_409_CONFLICT
+            )
+
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+        if length <= 0:
+            return Response({'detail': 'Empty chunk.'}, status=status.HTTP_400_BAD_REQUEST)
+        if offset + length > upload.size:
+            return Response(
+                {'detail': f'Chunk would exceed the declared size of {upload.size} bytes.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            with upload_lock(upload.temp_path):
+                # Re-read under the lock: a concurrent chunk may have landed since the check above
+                if not self._refresh(upload):
+                    return Response({'detail': 'Upload no longer exists.'}, status=status.HTTP_404_NOT_FOUND)
+                if upload.offset != offset:
+                    return Response(
+                        {'detail': 'Offset does not match the bytes received so far.', 'offset': upload.offset},
+                        status=status.HTTP_409_CONFLICT
+                    )
+                written = write_chunk(request.stream, upload.temp_path, offset, length)
+                # Only advance if nobody else moved the offset while we were writing
+                updated = RecipeImageUpload.objects.filter(pk=upload.pk, offset=offset).update(
+                    offset=offset + written, updated_at=timezone.now()
+                )
+        except UploadLocked:
+            return self._locked_response(upload)
+        upload.refresh_from_db()
+        if not updated:
+            return Response(
+                {'detail': 'A concurrent chunk was received for this upload.', 'offset': upload.offset},
+                status=status.HTTP_409_CONFLICT
+            )
+        return Response(self.get_serializer(upload).data)
+
+    @action(detail=True, methods=['post'])
+    def finalize(self, request, pk=None):
+        """
+        Validates the assembled file and attaches it to the recipe's image field.
+        """
+        upload = self.get_object()
+        try:
+            with upload_lock(upload.temp_path):
+                # A concurrent finalize may have attached (and discarded) the upload meanwhile
+                if not self._refresh(upload):
+                    return Response({'detail': 'Upload no longer exists.'}, status=status.HTTP_404_NOT_FOUND)
+                return self._finalize(request, upload)
+        except UploadLocked:
+            return self._locked_response(upload)
+
+    def _finalize(self, request, upload):
+        if not upload.is_complete:
+            return Response(
+                {'detail': 'Upload is incomplete.', 'offset': upload.offset, 'size': upload.size},
+                status=status.HTTP_409_CONFLICT
+            )
+
+        temp_path = upload.temp_path
+        if not os.path.exists(temp_path):
+            # The partial file was purged; the client has to start over
+            discard_upload(upload)
+            return Response({'detail': 'Upload no longer exists.'}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            validate_image_file(temp_path)
+        except ValidationError as exc:
+            discard_upload(upload)
+            return Response({'detail': exc.messages[0]}, status=status.HTTP_400_BAD_REQUEST)
+
+        recipe = upload.recipe
+        with transaction.atomic():
+            image_file = ChunkedUploadFile(temp_path, name=os.path.basename(upload.filename))
+            try:
+                # The storage moves the temp file into MEDIA_ROOT rather than copying it
+                recipe.image.save(image_file.name, image_file, save=True)
+            finally:
+                image_file.close()
+            # Still here if the storage already had the same content and kept its copy
+            discard_upload(upload)
+
+        return Response(RecipeSerializer(recipe, context={'request': request}).data)
+
+    def perform_destroy(self, instance):
+        discard_upload(instance)
+
+    def _refresh(self, upload):
+        """
+        Reloads the upload; returns False if it has been finalized or discarded meanwhile.
+        """
+        try:
+            upload.refresh_from_db()
+        except RecipeImageUpload.DoesNotExist:
+            return False
+        return True
+
+    def _locked_response(self, upload):
+        return Response(
+            {'detail': 'Another request for this upload is still in progress.', 'offset': upload.offset},
+            status=status.HTTP_409_CONFLICT
+        )
@@ -0,0 +1,158 @@
+# recipes/fast_boot.py
+"""
+Fast cold start for short-lived workers.
+
+Two things make a fresh worker slow to serve its first request: importing
+code it may never need (DRF's router, views and viewsets, the
+admin and every admin.py), and work that only happens on the first hit
+(importing the URLconf and views, compiling templates).
+
+- `lazy_path()` / `lazy_admin_path()` mount a URLconf that is only imported
+  when a URL under its prefix is first resolved or reversed. The URLconf
+  needs a namespace, so reverse() elsewhere doesn't have to look inside it.
+- With FAST_BOOT, the admin app does not autodiscover admin.py modules at
+  setup; `lazy_admin_path()` does it when /admin/ is first used.
+- `warm_up()`, called by the WSGI/ASGI entry points with FAST_BOOT, does the
+  first request's work up front: it compiles FAST_BOOT_WARM_TEMPLATES into
+  the cached template loader and resolves FAST_BOOT_WARM_PATHS, which
+  imports their views and populates the URL resolver's lookup tables.
+
+`manage.py startup_profile` measures the result.
+"""
+import threading
+from importlib import import_module
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.template import TemplateDoesNotExist
+from django.template.loader import get_template
+from django.urls import Resolver404, URLResolver, get_resolver, resolve, reverse
+from django.urls.resolvers import RoutePattern
+
+
+class LazyURLConf:
+    """
+    Stands in for a URLconf module; `urlpatterns` is loaded on first access.
+    """
+
+    def __init__(self, loader, description):
+        self.loader = loader
+        self.description = description
+        self._urlpatterns = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._urlpatterns is not None
+
+    @property
+    def urlpatterns(self):
+        if self._urlpatterns is None:
+            with self._lock:
+                if self._urlpatterns is None:
+                    self._urlpatterns = self.loader()
+        return self._urlpatterns
+
+    def __repr__(self):
+        state = 'loaded' if self.loaded else 'not loaded'
+        return f'<LazyURLConf {self.description} ({state})>'
+
+
+class LazyURLResolver(URLResolver):
+    """
+    URLResolver for a LazyURLConf.
+
+    When the parent resolver builds its reverse() lookup tables it only
+    records this resolver's namespace, instead of loading the URLconf to
+    collect its URL names; they are collected when the namespace is first
+    reversed.
+    """
+
+    def _load(self):
+        return self.urlconf_module.urlpatterns
+
+    def _populate(self):
+        if self.urlconf_module.loaded:
+            super()._populate()
+
+    @property
+    def reverse_dict(self):
+        self._load()
+        return super().reverse_dict
+
+    @property
+    def namespace_dict(self):
+        self._load()
+        return super().namespace_dict
+
+    @property
+    def app_dict(self):
+        self._load()
+        return super().app_dict
+
+
+def lazy_path(route, module_name, app_name, namespace=None):
+    """
+    Like path(route, include(module_name, namespace=...)), without importing the module yet.
+
+    `app_name` must match the module's own app_name (it can't be read from the
+    module without importing it); this is checked when the module loads.
+    """
+    def load():
+        module = import_module(module_name)
+        module_app_name = getattr(module, 'app_name', None)
+        if module_app_name is not None and module_app_name != app_name:
+            raise ImproperlyConfigured(
+                f"lazy_path('{route}', '{module_name}') declares app_name '{app_name}', "
+                f"but the module sets '{module_app_name}'."
+            )
+        return module.urlpatterns
+    return LazyURLResolver(
+        RoutePattern(route, is_endpoint=False), LazyURLConf(load, module_name),
+        app_name=app_name, namespace=namespace or app_name,
+    )
+
+
+def lazy_admin_path(route, site=None):
+    """
+    Like path(route, admin.site.urls), but admin.py modules are only discovered
+    and the admin's URLs only built when the admin is first resolved or reversed.
+    """
+    def load():
+        from django.contrib import admin
+        # A no-op if the admin app already autodiscovered at setup (FAST_BOOT off)
+        admin.autodiscover()
+        return (site or admin.site).get_urls()
+    name = site.name if site is not None else 'admin'
+    return LazyURLResolver(
+        RoutePattern(route, is_endpoint=False), LazyURLConf(load, f'{name} site'),
+        app_name='admin', namespace=name,
+    )
+
+
+def warm_up():
+    """
+    Compiles the configured templates and resolves the configured paths, so
+    the first real request finds everything loaded. Returns what was warmed.
+    """
+    templates = []
+    for name in getattr(settings, 'FAST_BOOT_WARM_TEMPLATES', []):
+        try:
+            get_template(name)
+        except TemplateDoesNotExist:
+            continue
+        templates.append(name)
+
+    paths = []
+    resolver = get_resolver()
+    resolver.reverse_dict  # Builds the root lookup tables (lazy URLconfs stay unloaded)
+    for path in getattr(settings, 'FAST_BOOT_WARM_PATHS', []):
+        try:
+            match = resolve(path)
+        except Resolver404:
+            continue
+        if match.url_name:
+            # Builds the lookup tables of the namespace the URL lives in
+            reverse(match.view_name, args=match.args, kwargs=match.kwargs)
+        paths.append(path)
+    return {'templates': templates, 'paths': paths}
@@ -0,0 +1,37 @@
+# recipes/management/commands/admission_stats.py
+import json
+
+from django.core.management.base import BaseCommand
+
+from recipes.admission import get_admission_controller
+
+
+class Command(BaseCommand):
+    """
+    Prints the shared admission control counters (in-flight, queued, shed) per route class.
+    """
+    help = 'Shows (or resets) the admission control counters shared by all worker processes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Clear all counters and slots.')
+        parser.add_argument('--json', action='store_true', help='Output JSON (for monitoring scripts).')
+
+    def handle(self, *args, **options):
+        controller = get_admission_controller()
+        if options['reset']:
+            controller.reset()
+            self.stdout.write(self.style.SUCCESS('Admission control state reset.'))
+            return
+
+        stats = controller.stats()
+        if options['json']:
+            self.stdout.write(json.dumps(stats, indent=2))
+            return
+        for name, values in stats.items():
+            self.stdout.write(self.style.MIGRATE_HEADING(f'{name} (priority {values["priority"]}):'))
+            self.stdout.write(
+                f"  in flight {values['in_flight']}/{values['max_concurrency']}, queued {values['queued']}\n"
+                f"  admitted {values['admitted']}, waited {values['queued_total']}, "
+                f"shed: queue full {values['shed_queue_full']}, timeout {values['shed_timeout']}, "
+                f"rate limited {values['shed_rate']}"
+            )
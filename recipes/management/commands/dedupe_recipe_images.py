@@ -0,0 +1,62 @@
+# recipes/management/commands/dedupe_recipe_images.py
+from django.core.files import File
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from recipes.models import Recipe
+from recipes.storage import is_content_addressed_name
+
+
+class Command(BaseCommand):
+    """
+    Moves existing recipe images into content-addressed storage.
+
+    Each image that still has a legacy name (e.g. test_image_7hHT1WE.jpg) is
+    re-stored under its SHA-256 digest, so identical copies collapse into one
+    file, and the recipe row is pointed at the new name. The legacy files are
+    left in place; run `gc_recipe_images` afterwards to remove them.
+    """
+    help = 'Re-stores legacy recipe images under their content digest so duplicates share one file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Report what would change without writing anything.',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        storage = Recipe._meta.get_field('image').storage
+        migrated = 0
+        blobs = set()
+
+        recipes = Recipe.objects.exclude(image='').exclude(image__isnull=True).only('pk', 'image')
+        for recipe in recipes.iterator(chunk_size=500):
+            name = recipe.image.name
+            if is_content_addressed_name(name):
+                continue
+            if not storage.exists(name):
+                self.stderr.write(self.style.WARNING(f'Recipe {recipe.pk}: image file {name} is missing, skipped.'))
+                continue
+
+            if dry_run:
+                self.stdout.write(f'Would re-store {name} (recipe {recipe.pk})')
+                migrated += 1
+                continue
+
+            with storage.open(name, 'rb') as f:
+                new_name = storage.save(name, File(f, name=name))
+            # Bump updated_at so pre-rendered pages pick up the new image URL
+            Recipe.objects.filter(pk=recipe.pk).update(image=new_name, updated_at=timezone.now())
+            blobs.add(new_name)
+            migrated += 1
+            if options['verbosity'] >= 2:
+                self.stdout.write(f'  {name} -> {new_name}')
+
+        if dry_run:
+            self.stdout.write(self.style.SUCCESS(f'{migrated} image(s) would be re-stored.'))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'Re-stored {migrated} image(s) as {len(blobs)} distinct file(s). '
+                f'Run "manage.py gc_recipe_images" to remove the old copies.'
+            ))
@@ -0,0 +1,71 @@
+# recipes/management/commands/gc_recipe_images.py
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    """
+    Garbage-collects recipe image files that no recipe references.
+
+    Content-addressed images can be shared, so they are never deleted when a
+    recipe changes or goes away. This command streams over the image column to
+    collect the referenced names, then removes every other file in the image
+    upload directory that is older than --min-age (which protects files whose
+    upload is still in flight).
+    """
+    help = 'Removes recipe image files that are no longer referenced by any recipe.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='List orphaned files without deleting them.',
+        )
+        parser.add_argument(
+            '--min-age', type=int, default=3600,
+            help='Only remove files last modified at least this many seconds ago (default: 3600).',
+        )
+
+    def handle(self, *args, **options):
+        field = Recipe._meta.get_field('image')
+        storage = field.storage
+        upload_dir = storage.path(field.upload_to)
+        if not os.path.isdir(upload_dir):
+            self.stdout.write('No image directory, nothing to collect.')
+            return
+
+        referenced = set(
+            Recipe.objects.exclude(image='').exclude(image__isnull=True)
+            .values_list('image', flat=True).iterator(chunk_size=2000)
+        )
+
+        cutoff = time.time() - options['min_age']
+        removed = 0
+        freed = 0
+        for dirpath, dirnames, filenames in os.walk(upload_dir):
+            for filename in filenames:
+                full_path = os.path.join(dirpath, filename)
+                name = os.path.relpath(full_path, storage.location).replace(os.sep, '/')
+                if name in referenced:
+                    continue
+                stat = os.stat(full_path)
+                if stat.st_mtime > cutoff:
+                    continue
+
+                if options['dry_run']:
+                    self.stdout.write(f'Would remove {name}')
+                else:
+                    if hasattr(storage, 'delete_blob'):
+                        storage.delete_blob(name)
+                    else:
+                        storage.delete(name)
+                    if options['verbosity'] >= 2:
+                        self.stdout.write(f'  removed {name}')
+                removed += 1
+                freed += stat.st_size
+
+        verb = 'Would remove' if options['dry_run'] else 'Removed'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {removed} orphaned file(s), {freed} bytes.'))
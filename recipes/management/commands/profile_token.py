@@ -0,0 +1,20 @@
+# recipes/management/commands/profile_token.py
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from recipes.profiling import TOKEN_HEADER, make_profile_token
+
+
+class Command(BaseCommand):
+    """
+    Prints a signed token that makes RequestProfilerMiddleware profile a request.
+
+    Usage:
+        curl -H "X-Profile-Token: $(python manage.py profile_token)" http://host/recipes/?q=paella
+    """
+    help = 'Prints a signed token that enables profiling for requests carrying it.'
+
+    def handle(self, *args, **options):
+        self.stdout.write(make_profile_token())
+        max_age = getattr(settings, 'PROFILER_TOKEN_MAX_AGE', 3600)
+        self.stderr.write(f'Send it as the {TOKEN_HEADER} header (or ?_profile=); valid for {max_age} seconds.')
@@ -0,0 +1,34 @@
+# recipes/management/commands/purge_uploads.py
+from django.core.management.base import BaseCommand
+
+from recipes.uploads import get_upload_expiry, purge_expired_uploads
+
+
+class Command(BaseCommand):
+    """
+    Discards chunked uploads that were abandoned before being finalized.
+
+    An upload expires CHUNKED_UPLOAD_EXPIRY seconds after its last chunk
+    (override with --max-age); its session and partial file are removed, as
+    are leftover files in CHUNKED_UPLOAD_TEMP_DIR that belong to no upload.
+    Run it periodically, e.g. from cron.
+    """
+    help = 'Removes expired, unfinished chunked image uploads and their partial files.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-age', type=int, default=None,
+            help='Seconds since the last chunk after which an upload expires (default: CHUNKED_UPLOAD_EXPIRY).',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Count what would be removed without removing it.',
+        )
+
+    def handle(self, *args, **options):
+        max_age = get_upload_expiry() if options['max_age'] is None else options['max_age']
+        uploads, files = purge_expired_uploads(max_age=max_age, dry_run=options['dry_run'])
+        verb = 'Would remove' if options['dry_run'] else 'Removed'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {uploads} expired upload(s) and {files} orphaned file(s).'
+        ))
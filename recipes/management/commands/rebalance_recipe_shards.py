@@ -0,0 +1,149 @@
+# recipes/management/commands/rebalance_recipe_shards.py
+from contextlib import contextmanager
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, connections, transaction
+from django.db.models import Max
+
+from recipes.models import Recipe, RecipeImageUpload, ShardIdSequence
+from recipes.sharding import (
+    COORDINATOR_DATABASE, RECIPE_ID_SEQUENCE, get_shard_aliases, migrate_shards, shard_for_instance,
+)
+
+
+@contextmanager
+def preserved_timestamps(*models):
+    """
+    Turns off auto_now/auto_now_add while rows are copied, so they keep their timestamps.
+    """
+    saved = []
+    for model in models:
+        for field in model._meta.concrete_fields:
+            if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False):
+                saved.append((field, field.auto_now, field.auto_now_add))
+                field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+    """
+    Moves recipes to the shard that owns them under the current RECIPE_SHARDS.
+
+    Run it after changing the list of shards. Every current shard, plus the
+    databases given with --from (the unsharded `default` database when sharding
+    is first turned on, or shards that were removed from the list), is scanned
+    in id order; recipes found on the wrong shard are copied, together with
+    their image uploads, to their owner and then deleted from the source.
+    Copying commits before deleting, so an interrupted run can simply be
+    repeated: recipes already present on their owner are not copied again.
+    """
+    help = 'Moves recipes (and their uploads) to their owning shard after RECIPE_SHARDS changed.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--from', dest='sources', action='append', default=[], metavar='ALIAS',
+            help='Also drain this database alias (e.g. default, or a removed shard). Repeatable.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Number of recipes read from a source per batch (default: 500).',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Report how many recipes would move without changing anything.',
+        )
+
+    def handle(self, *args, **options):
+        shards = get_shard_aliases()
+        if not shards:
+            raise CommandError('RECIPE_SHARDS is empty: configure the shard aliases first.')
+        sources = list(dict.fromkeys(shards + options['sources']))
+        unknown = [alias for alias in sources if alias not in connections]
+        if unknown:
+            raise CommandError(f"Unknown database alias(es): {', '.join(unknown)}.")
+        if options['batch_size'] <= 0:
+            raise CommandError('--batch-size must be positive.')
+
+        if not options['dry_run']:
+            migrate_shards(shards, verbosity=max(options['verbosity'] - 1, 0))
+
+        total = 0
+        for source in sources:
+            moved = self.drain(source, shards, options['batch_size'], options['dry_run'])
+            total += moved
+            verb = 'would move' if options['dry_run'] else 'moved'
+            self.stdout.write(f'{source}: {verb} {moved} recipe(s).')
+
+        if not options['dry_run']:
+            self.advance_id_sequence()
+        verb = 'Would move' if options['dry_run'] else 'Moved'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {total} recipe(s) across {len(shards)} shard(s).'))
+
+    def drain(self, source, shards, batch_size, dry_run):
+        """
+        Moves every recipe on `source` that belongs on another shard. Returns how many moved.
+        """
+        moved = 0
+        last_pk = 0
+        recipes = Recipe.objects.using(source).order_by('pk')
+        while True:
+            batch = list(recipes.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                return moved
+            last_pk = batch[-1].pk
+
+            by_target = {}
+            for recipe in batch:
+                target = shard_for_instance(recipe, shards)
+                if target != source:
+                    by_target.setdefault(target, []).append(recipe)
+            for target, recipes_to_move in by_target.items():
+                if not dry_run:
+                    self.move(source, target, recipes_to_move)
+                moved += len(recipes_to_move)
+
+    def move(self, source, target, recipes):
+        ids = [recipe.pk for recipe in recipes]
+        uploads = list(RecipeImageUpload.objects.using(source).filter(recipe_id__in=ids))
+
+        # Left over from an interrupted run; anything else with the same id is a conflict
+        existing = dict(Recipe.objects.using(target).filter(pk__in=ids).values_list('pk', 'title'))
+        for recipe in recipes:
+            if recipe.pk in existing and existing[recipe.pk] != recipe.title:
+                raise CommandError(
+                    f'Recipe {recipe.pk} on {source} conflicts with a different recipe with the same id on {target}.'
+                )
+        already_copied = set(existing)
+        try:
+            with transaction.atomic(using=target), preserved_timestamps(Recipe, RecipeImageUpload):
+                Recipe.objects.using(target).bulk_create(
+                    [recipe for recipe in recipes if recipe.pk not in already_copied]
+                )
+                copied_uploads = set(
+                    RecipeImageUpload.objects.using(target).filter(recipe_id__in=ids).values_list('pk', flat=True)
+                )
+                RecipeImageUpload.objects.using(target).bulk_create(
+                    [upload for upload in uploads if upload.pk not in copied_uploads]
+                )
+        except IntegrityError as exc:
+            raise CommandError(
+                f'Could not copy recipes {ids[0]}..{ids[-1]} from {source} to {target}: {exc}. '
+                'A recipe with the same title probably exists on the target shard.'
+            )
+
+        # Only delete once the copies are committed
+        with transaction.atomic(using=source):
+            Recipe.objects.using(source).filter(pk__in=ids).delete()
+
+    def advance_id_sequence(self):
+        """
+        Makes sure the id allocator continues after the highest id now stored.
+        """
+        highest = Recipe.objects.aggregate(highest=Max('pk'))['highest'] or 0
+        ShardIdSequence.objects.using(COORDINATOR_DATABASE).filter(
+            name=RECIPE_ID_SEQUENCE, next_value__lte=highest
+        ).update(next_value=highest + 1)
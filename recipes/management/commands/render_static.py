@@ -0,0 +1,59 @@
+# recipes/management/commands/render_static.py
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.static_render import build_static_site, get_output_root
+
+
+class Command(BaseCommand):
+    """
+    Pre-renders every recipe list page and detail page into static HTML.
+
+    Usage:
+        python manage.py render_static                # incremental rebuild
+        python manage.py render_static --full         # re-render everything
+        python manage.py render_static --workers 4    # render in 4 processes
+    """
+    help = 'Pre-renders the recipe list and detail pages into a static output directory.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output', default=None,
+            help='Output directory (defaults to settings.STATIC_RENDER_ROOT).',
+        )
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Ignore the build manifest and re-render every page (e.g. after a template change).',
+        )
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help='Number of worker processes used for rendering (1 renders in-process).',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=50,
+            help='Number of pages handed to a worker at a time.',
+        )
+
+    def handle(self, *args, **options):
+        output_root = options['output'] or get_output_root()
+        started = time.perf_counter()
+        result = build_static_site(
+            output_root=output_root,
+            full=options['full'],
+            workers=options['workers'],
+            batch_size=options['batch_size'],
+        )
+        elapsed = time.perf_counter() - started
+
+        if options['verbosity'] >= 2:
+            for rel_path in result['rendered']:
+                self.stdout.write(f'  rendered {rel_path}')
+            for rel_path in result['removed']:
+                self.stdout.write(f'  removed  {rel_path}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Rendered {len(result['rendered'])} page(s), skipped {len(result['skipped'])} unchanged, "
+            f"removed {len(result['removed'])} in {elapsed:.2f}s -> {output_root}"
+        ))
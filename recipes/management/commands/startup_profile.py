@@ -0,0 +1,199 @@
+# recipes/management/commands/startup_profile.py
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+PHASE_MARKER = 'startup_profile:phase:'
+
+# Runs in a fresh interpreter under `python -X importtime`: boots the WSGI
+# application, then sends each path to it twice (cold, then warm). Phase
+# markers on stderr split the import log into boot and per-request parts.
+CHILD_SCRIPT = r'''
+import importlib, io, json, sys, time
+from wsgiref.util import setup_testing_defaults
+started = time.perf_counter()
+config = json.loads(sys.argv[1])
+
+def mark(phase):
+    print(config['marker'] + phase, file=sys.stderr, flush=True)
+
+mark('boot')
+module_name, attribute = config['application'].rsplit('.', 1)
+application = getattr(importlib.import_module(module_name), attribute)
+booted = time.perf_counter()
+
+requests = []
+first_response = None
+for index, full_path in enumerate(config['paths']):
+    path, _, query = full_path.partition('?')
+    for attempt in ('cold', 'warm'):
+        mark('request:%d:%s' % (index, attempt))
+        environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query,
+                   'HTTP_HOST': config['host'], 'SERVER_NAME': config['host'], 'wsgi.input': io.BytesIO()}
+        setup_testing_defaults(environ)
+        statuses = []
+        request_started = time.perf_counter()
+        body = application(environ, lambda status, headers, exc_info=None: statuses.append(status))
+        try:
+            for chunk in body:
+                pass
+        finally:
+            if hasattr(body, 'close'):
+                body.close()
+        finished = time.perf_counter()
+        if first_response is None:
+            first_response = finished
+        requests.append({'path': full_path, 'attempt': attempt, 'status': int(statuses[0].split()[0]),
+                         'ms': round((finished - request_started) * 1000, 3)})
+mark('done')
+print(json.dumps({
+    'boot_ms': round((booted - started) * 1000, 3),
+    'time_to_first_response_ms': round(((first_response or booted) - started) * 1000, 3),
+    'requests': requests,
+}))
+'''
+
+IMPORTTIME_RE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)$')
+
+
+def parse_importtime(stderr):
+    """
+    Splits `python -X importtime` output into phases.
+
+    Returns {phase: [{'module', 'self_ms', 'cumulative_ms', 'depth'}]} in import
+    order; imports before the first phase marker are under 'interpreter'.
+    """
+    phases = {'interpreter': []}
+    current = phases['interpreter']
+    for line in stderr.splitlines():
+        if line.startswith(PHASE_MARKER):
+            current = phases.setdefault(line[len(PHASE_MARKER):].strip(), [])
+            continue
+        match = IMPORTTIME_RE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            current.append({
+                'module': module,
+                'self_ms': int(self_us) / 1000,
+                'cumulative_ms': int(cumulative_us) / 1000,
+                'depth': (len(indent) - 1) // 2,
+            })
+    return phases
+
+
+class Command(BaseCommand):
+    """
+    Measures a cold start: boots the WSGI application in a fresh interpreter
+    under `python -X importtime`, sends it a few requests and reports the boot
+    time, the time to the first response, and the slowest imports of each
+    phase. --max-boot-ms / --max-first-response-ms turn it into a regression check.
+
+    Modules loaded with importlib.import_module() (the settings, URLconfs and
+    apps) are not listed by -X importtime; their own time is counted in the
+    module that loaded them, but their imports are listed.
+    """
+    help = 'Reports per-module import time and time-to-first-response of a fresh worker.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path', dest='paths', action='append', metavar='PATH',
+            help='Path to request after boot (repeatable, default: /recipes/). Each is requested twice.',
+        )
+        parser.add_argument('--host', help='Host header for the requests (default: from ALLOWED_HOSTS, else 127.0.0.1).')
+        mode = parser.add_mutually_exclusive_group()
+        mode.add_argument('--fast-boot', dest='fast_boot', action='store_const', const=True,
+                          help='Profile with FAST_BOOT on (RECIPE_BOOK_FAST_BOOT=1).')
+        mode.add_argument('--no-fast-boot', dest='fast_boot', action='store_const', const=False,
+                          help='Profile with FAST_BOOT off.')
+        parser.add_argument('--top', type=int, default=20, help='Slowest imports listed per phase (default: 20).')
+        parser.add_argument('--json', action='store_true', help='Output the full report as JSON.')
+        parser.add_argument('--max-boot-ms', type=float, help='Fail if booting takes longer than this.')
+        parser.add_argument('--max-first-response-ms', type=float,
+                            help='Fail if the first response (counted from process start) takes longer than this.')
+
+    def handle(self, *args, **options):
+        report = self.run_child(options)
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self.print_report(report, options['top'])
+
+        failures = []
+        if options['max_boot_ms'] is not None and report['boot_ms'] > options['max_boot_ms']:
+            failures.append(f"boot took {report['boot_ms']:.1f} ms (limit {options['max_boot_ms']:.1f} ms)")
+        if (options['max_first_response_ms'] is not None
+                and report['time_to_first_response_ms'] > options['max_first_response_ms']):
+            failures.append(
+                f"first response after {report['time_to_first_response_ms']:.1f} ms "
+                f"(limit {options['max_first_response_ms']:.1f} ms)"
+            )
+        if failures:
+            raise CommandError('Startup budget exceeded: ' + '; '.join(failures) + '.')
+
+    def default_host(self):
+        for host in settings.ALLOWED_HOSTS:
+            if host != '*':
+                return host.lstrip('.')
+        return '127.0.0.1'
+
+    def run_child(self, options):
+        env = os.environ.copy()
+        env['DJANGO_SETTINGS_MODULE'] = settings.SETTINGS_MODULE
+        env['PYTHONPATH'] = os.pathsep.join(filter(None, [str(settings.BASE_DIR), env.get('PYTHONPATH')]))
+        if options['fast_boot'] is not None:
+            env['RECIPE_BOOK_FAST_BOOT'] = '1' if options['fast_boot'] else '0'
+        config = {
+            'application': settings.WSGI_APPLICATION,
+            'paths': options['paths'] or ['/recipes/'],
+            'host': options['host'] or self.default_host(),
+            'marker': PHASE_MARKER,
+        }
+
+        started = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', CHILD_SCRIPT, json.dumps(config)],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+        )
+        process_ms = (time.perf_counter() - started) * 1000
+        if result.returncode != 0:
+            errors = [line for line in result.stderr.splitlines() if not line.startswith('import time:')]
+            raise CommandError('The profiled process failed:\n' + '\n'.join(errors[-20:]))
+
+        report = json.loads(result.stdout.strip().splitlines()[-1])
+        phases = parse_importtime(result.stderr)
+        report['process_ms'] = round(process_ms, 3)
+        report['fast_boot'] = env.get('RECIPE_BOOK_FAST_BOOT') == '1'
+        report['imports'] = {
+            phase: modules for phase, modules in phases.items() if phase not in ('interpreter', 'done')
+        }
+        return report
+
+    def print_report(self, report, top):
+        style = self.style
+        self.stdout.write(style.MIGRATE_HEADING(f"Startup profile (FAST_BOOT {'on' if report['fast_boot'] else 'off'})"))
+        self.stdout.write(f"  boot (import {settings.WSGI_APPLICATION}): {report['boot_ms']:.1f} ms")
+        self.stdout.write(f"  time to first response: {report['time_to_first_response_ms']:.1f} ms")
+        self.stdout.write(f"  whole process incl. interpreter start: {report['process_ms']:.1f} ms")
+        for request in report['requests']:
+            line = f"  GET {request['path']} ({request['attempt']}): {request['status']} in {request['ms']:.1f} ms"
+            self.stdout.write(line if request['status'] < 400 else style.WARNING(line))
+
+        for phase, modules in report['imports'].items():
+            if not modules:
+                continue
+            total_ms = sum(module['self_ms'] for module in modules)
+            self.stdout.write(style.MIGRATE_HEADING(
+                f'\nImports during {phase}: {len(modules)} modules, {total_ms:.1f} ms'
+            ))
+            self.stdout.write(f"  {'cumulative ms':>13}  {'self ms':>8}  module")
+            for module in sorted(modules, key=lambda module: module['cumulative_ms'], reverse=True)[:top]:
+                self.stdout.write(
+                    f"  {module['cumulative_ms']:>13.1f}  {module['self_ms']:>8.1f}  "
+                    f"{'  ' * module['depth']}{module['module']}"
+                )
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.4 on 2026-10-19 10:41
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeImageUpload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('filename', models.CharField(help_text='Original file name of the image.', max_length=255)),
+                ('size', models.PositiveBigIntegerField(help_text='Total size of the image in bytes, declared when the upload is initiated.')),
+                ('offset', models.PositiveBigIntegerField(default=0, help_text='Number of bytes received so far.')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('recipe', models.ForeignKey(help_text='The recipe the image will be attached to once the upload is finalized.', on_delete=django.db.models.deletion.CASCADE, related_name='image_uploads', to='recipes.recipe')),
+            ],
+            options={
+                'verbose_name': 'Recipe image upload',
+                'verbose_name_plural': 'Recipe image uploads',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
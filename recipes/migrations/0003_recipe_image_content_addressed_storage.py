@@ -0,0 +1,19 @@
+# Generated by Django 5.2.4 on 2026-10-19 10:42
+
+import recipes.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0002_recipeimageupload'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(blank=True, help_text='Upload an image for the recipe. Optional.', null=True, storage=recipes.storage.recipe_image_storage, upload_to='recipe_images/'),
+        ),
+    ]
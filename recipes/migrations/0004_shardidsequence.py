@@ -0,0 +1,24 @@
+# Generated by Django 5.2.4 on 2026-10-19 10:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0003_recipe_image_content_addressed_storage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShardIdSequence',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('next_value', models.BigIntegerField(help_text='First id not yet reserved by any process.')),
+            ],
+            options={
+                'verbose_name': 'Shard id sequence',
+                'verbose_name_plural': 'Shard id sequences',
+            },
+        ),
+    ]
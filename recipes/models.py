@@ -1,6 +1,11 @@
+import uuid
+
 from django.db import models
 from django.urls import reverse
 
+from .sharding import RECIPE_ID_SEQUENCE, ShardedQuerySet, allocate_id, is_sharding_enabled
+from .storage import recipe_image_storage
+
 class Recipe(models.Model):
     """
     Represents a single recipe in the personal collection.
@@ -12,6 +17,7 @@ class Recipe(models.Model):
     )
     image = models.ImageField(
         upload_to='recipe_images/',  # Images will be stored in media/recipe_images/
+        storage=recipe_image_storage,  # Stored once per distinct content, named by SHA-256 digest
         blank=True,  # Image is optional
         null=True,   # Allows the database column to be NULL
         help_text="Upload an image for the recipe. Optional."
@@ -37,6 +43,10 @@ class Recipe(models.Model):
         help_text="The date and time when the recipe was last updated."
     )
 
+    # With RECIPE_SHARDS set, rows are partitioned across databases by id (see recipes/sharding.py)
+    shard_key = 'id'
+    objects = ShardedQuerySet.as_manager()
+
     class Meta:
         # Define the default ordering for querysets
         ordering = ['title']
@@ -50,6 +60,15 @@ class Recipe(models.Model):
         """
         return self.title
 
+    def save(self, *args, **kwargs):
+        """
+        When sharding is enabled, takes the id from the global allocator before
+        the first save, since the id decides which shard the row goes to.
+        """
+        if self.pk is None and is_sharding_enabled():
+            self.pk = allocate_id(RECIPE_ID_SEQUENCE)
+        super().save(*args, **kwargs)
+
     def get_absolute_url(self):
         """
         Returns the URL to access a particular instance of the recipe.
@@ -66,4 +85,81 @@ class Recipe(models.Model):
             return self.image.url
         elif self.image_url:
             return self.image_url
-        return 'https://via.placeholder.com/150?text=No+Image' # Placeholder if neither is provided
\ No newline at end of file
+        return 'https://via.placeholder.com/150?text=No+Image' # Placeholder if neither is provided
+
+class RecipeImageUpload(models.Model):
+    """
+    An in-progress resumable image upload for a recipe.
+
+    The client declares the total size up front, then sends the bytes in
+    chunks; `offset` is how many bytes have been received so far, so an
+    interrupted upload can resume from there instead of starting over.
+    """
+    id = models.UUIDField(
+        primary_key=True,
+        default=uuid.uuid4,
+        editable=False
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='image_uploads',
+        help_text="The recipe the image will be attached to once the upload is finalized."
+    )
+    filename = models.CharField(
+        max_length=255,
+        help_text="Original file name of the image."
+    )
+    size = models.PositiveBigIntegerField(
+        help_text="Total size of the image in bytes, declared when the upload is initiated."
+    )
+    offset = models.PositiveBigIntegerField(
+        default=0,
+        help_text="Number of bytes received so far."
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    # Stored on the same shard as its recipe
+    shard_key = 'recipe_id'
+    objects = ShardedQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = "Recipe image upload"
+        verbose_name_plural = "Recipe image uploads"
+
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.size} bytes)"
+
+    @property
+    def temp_path(self):
+        """
+        Location of the partially received file on disk.
+        """
+        from .uploads import get_upload_temp_dir
+        return get_upload_temp_dir() / f'{self.id}.part'
+
+    @property
+    def is_complete(self):
+        return self.offset == self.size
+
+class ShardIdSequence(models.Model):
+    """
+    Next free id of a globally unique id sequence, used when recipes are
+    sharded. Always stored in the `default` database.
+    """
+    name = models.CharField(
+        max_length=50,
+        primary_key=True
+    )
+    next_value = models.BigIntegerField(
+        help_text="First id not yet reserved by any process."
+    )
+
+    class Meta:
+        verbose_name = "Shard id sequence"
+        verbose_name_plural = "Shard id sequences"
+
+    def __str__(self):
+        return f"{self.name} (next: {self.next_value})"
@@ -0,0 +1,336 @@
+# recipes/profiling.py
+"""
+On-demand request profiling.
+
+RequestProfilerMiddleware profiles a request when it carries a valid signed
+token (X-Profile-Token header or ?_profile= query parameter, see
+`manage.py profile_token`) or is picked by PROFILER_SAMPLE_RATE. The request
+runs under cProfile (per-function call counts and timings) or a sampling
+profiler (collapsed stacks for flame graphs), every SQL statement is recorded,
+and the result is stored as JSON in PROFILER_STORAGE_DIR, whose size is kept
+within PROFILER_MAX_PROFILES / PROFILER_MAX_BYTES. Staff can browse the
+stored profiles under /admin/profiles/.
+"""
+import cProfile
+import json
+import os
+import pstats
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.conf import settings
+from django.core import signing
+from django.db import connections
+from django.utils import timezone
+from django.utils.encoding import escape_uri_path
+
+TOKEN_SALT = 'recipes.profiling'
+TOKEN_VALUE = 'profile'
+TOKEN_HEADER = 'X-Profile-Token'
+TOKEN_QUERY_PARAM = '_profile'
+
+PROFILE_ID_RE = re.compile(r'^[0-9]{20}-[0-9a-f]{32}$')
+
+# Caps on what a single profile stores
+MAX_FUNCTIONS = 200
+MAX_SQL_STATEMENTS = 500
+MAX_SQL_LENGTH = 2000
+
+
+def get_storage_dir():
+    return Path(getattr(settings, 'PROFILER_STORAGE_DIR', settings.BASE_DIR / 'profiles'))
+
+
+def make_profile_token():
+    """
+    Returns a signed, time-limited token that enables profiling for a request.
+    """
+    return signing.TimestampSigner(salt=TOKEN_SALT).sign(TOKEN_VALUE)
+
+
+def is_valid_profile_token(token):
+    try:
+        value = signing.TimestampSigner(salt=TOKEN_SALT).unsign(
+            token, max_age=getattr(settings, 'PROFILER_TOKEN_MAX_AGE', 3600)
+        )
+    except signing.BadSignature:
+        return False
+    return value == TOKEN_VALUE
+
+
+def profiled_path(request):
+    """
+    The request's path and query string as stored in its profile, without
+    the ?_profile= token, which would otherwise stay usable from the viewer.
+    """
+    query = request.GET.copy()
+    query.pop(TOKEN_QUERY_PARAM, None)
+    path = escape_uri_path(request.path)
+    return f'{path}?{query.urlencode()}' if query else path
+
+
+class SQLRecorder:
+    """
+    Database execute wrapper that records every statement and its duration.
+    """
+
+    def __init__(self):
+        self.statements = []
+        self.total_ms = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration_ms = (time.perf_counter() - started) * 1000
+            self.total_ms += duration_ms
+            if len(self.statements) < MAX_SQL_STATEMENTS:
+                self.statements.append({
+                    'alias': context['connection'].alias,
+                    'sql': sql[:MAX_SQL_LENGTH],
+                    'many': many,
+                    'duration_ms': round(duration_ms, 3),
+                })
+
+
+def frame_label(frame):
+    code = frame.f_code
+    module = frame.f_globals.get('__name__', '?')
+    return f"{module}.{getattr(code, 'co_qualname', code.co_name)}"
+
+
+class StackSampler:
+    """
+    Samples the call stack of one thread at a fixed interval from a
+    background thread, counting identical stacks ("collapsed stacks").
+    """
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            labels = []
+            while frame is not None:
+                labels.append(frame_label(frame))
+                frame = frame.f_back
+            if labels:
+                self.stacks[';'.join(reversed(labels))] += 1
+
+    def function_timings(self):
+        """
+        Per-function self/total time estimated from the samples.
+        """
+        self_samples = Counter()
+        total_samples = Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(';')
+            self_samples[frames[-1]] += count
+            for name in set(frames):
+                total_samples[name] += count
+        interval_ms = self.interval * 1000
+        return [
+            {
+                'name': name,
+                'calls': None,
+                'self_ms': round(self_samples[name] * interval_ms, 3),
+                'total_ms': round(total * interval_ms, 3),
+            }
+            for name, total in total_samples.most_common(MAX_FUNCTIONS)
+        ]
+
+
+def cprofile_timings(profiler):
+    """
+    Converts a cProfile run into a list of per-function timings, slowest (cumulative) first.
+    """
+    stats = pstats.Stats(profiler)
+    rows = []
+    for (filename, line, name), (cc, ncalls, tottime, cumtime, callers) in stats.stats.items():
+        rows.append({
+            'name': f'{name} ({filename}:{line})' if filename != '~' else name,
+            'calls': ncalls,
+            'self_ms': round(tottime * 1000, 3),
+            'total_ms': round(cumtime * 1000, 3),
+        })
+    rows.sort(key=lambda row: row['total_ms'], reverse=True)
+    return rows[:MAX_FUNCTIONS]
+
+
+def save_profile(data):
+    """
+    Writes a profile to the storage directory, then enforces the retention limits.
+    """
+    storage_dir = get_storage_dir()
+    storage_dir.mkdir(parents=True, exist_ok=True)
+    path = storage_dir / f"{data['id']}.json"
+    tmp_path = path.with_suffix('.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+    prune_profiles()
+
+
+def prune_profiles():
+    """
+    Deletes the oldest profiles until both PROFILER_MAX_PROFILES and PROFILER_MAX_BYTES hold.
+    """
+    max_profiles = getattr(settings, 'PROFILER_MAX_PROFILES', 100)
+    max_bytes = getattr(settings, 'PROFILER_MAX_BYTES', 50 * 1024 * 1024)
+    files = sorted(get_storage_dir().glob('*.json'))  # Names start with a timestamp: oldest first
+    sizes = [f.stat().st_size for f in files]
+    total = sum(sizes)
+    while files and (len(files) > max_profiles or total > max_bytes):
+        oldest = files.pop(0)
+        total -= sizes.pop(0)
+        oldest.unlink(missing_ok=True)
+
+
+def list_profiles():
+    """
+    Returns the stored profiles' summaries, newest first.
+    """
+    profiles = []
+    for path in sorted(get_storage_dir().glob('*.json'), reverse=True):
+        data = load_profile(path.stem)
+        if data is not None:
+            data.pop('functions', None)
+            data.pop('sql', None)
+            data.pop('stacks', None)
+            profiles.append(data)
+    return profiles
+
+
+def load_profile(profile_id):
+    """
+    Loads one stored profile, or returns None if it does not exist.
+    """
+    if not PROFILE_ID_RE.match(profile_id):
+        return None
+    try:
+        with open(get_storage_dir() / f'{profile_id}.json') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def flame_graph_tree(stacks):
+    """
+    Turns collapsed stacks into the nested {name, value, children} tree used by
+    flame graph renderers such as d3-flame-graph.
+    """
+    root = {'name': 'all', 'value': 0, 'children': {}}
+    for stack, count in stacks.items():
+        root['value'] += count
+        node = root
+        for name in stack.split(';'):
+            child = node['children'].setdefault(name, {'name': name, 'value': 0, 'children': {}})
+            child['value'] += count
+            node = child
+
+    def finish(node):
+        node['children'] = [finish(child) for child in node['children'].values()]
+        return node
+    return finish(root)
+
+
+class RequestProfilerMiddleware:
+    """
+    Profiles requests selected by a signed token or by sampling and stores the result.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        trigger = self.get_trigger(request)
+        if trigger is None:
+            return self.get_response(request)
+        return self.profile_request(request, trigger)
+
+    def get_trigger(self, request):
+        if not getattr(settings, 'PROFILER_ENABLED', False):
+            return None
+        if request.path.startswith('/admin/profiles/'):
+            return None  # Never profile the profile viewer itself
+        token = request.headers.get(TOKEN_HEADER) or request.GET.get(TOKEN_QUERY_PARAM)
+        if token:
+            return 'token' if is_valid_profile_token(token) else None
+        sample_rate = getattr(settings, 'PROFILER_SAMPLE_RATE', 0.0)
+        if sample_rate and random.random() < sample_rate:
+            return 'sample'
+        return None
+
+    def profile_request(self, request, trigger):
+        mode = getattr(settings, 'PROFILER_MODE', 'cprofile')
+        sql = SQLRecorder()
+        profiler = sampler = None
+
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(sql))
+            if mode == 'sampling':
+                sampler = StackSampler(threading.get_ident(), getattr(settings, 'PROFILER_SAMPLING_INTERVAL', 0.001))
+                sampler.start()
+            else:
+                profiler = cProfile.Profile()
+                try:
+                    profiler.enable()
+                except ValueError:
+                    profiler = None  # Another profiler is already active in this thread
+            try:
+                response = self.get_response(request)
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+                if sampler is not None:
+                    sampler.stop()
+        duration_ms = (time.perf_counter() - started) * 1000
+
+        now = timezone.now()
+        profile_id = f"{now.strftime('%Y%m%d%H%M%S%f')}-{uuid.uuid4().hex}"
+        data = {
+            'id': profile_id,
+            'created_at': now.isoformat(),
+            'method': request.method,
+            'path': profiled_path(request),
+            'status_code': response.status_code,
+            'duration_ms': round(duration_ms, 3),
+            'trigger': trigger,
+            'mode': mode,
+            'sql_count': len(sql.statements),
+            'sql_total_ms': round(sql.total_ms, 3),
+            'sql': sql.statements,
+            'functions': [],
+            'stacks': {},
+        }
+        if profiler is not None:
+            data['functions'] = cprofile_timings(profiler)
+        if sampler is not None:
+            data['functions'] = sampler.function_timings()
+            data['stacks'] = dict(sampler.stacks)
+        save_profile(data)
+
+        response['X-Profile-Id'] = profile_id
+        return response
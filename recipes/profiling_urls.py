@@ -0,0 +1,15 @@
+# recipes/profiling_urls.py
+from django.urls import path
+from . import profiling_views
+
+app_name = 'profiling'
+
+urlpatterns = [
+    # Recent profiles
+    path('', profiling_views.profile_list, name='profile_list'),
+
+    # One profile (HTML), its collapsed stacks (text) and flame graph tree (JSON)
+    path('<str:profile_id>/', profiling_views.profile_detail, name='profile_detail'),
+    path('<str:profile_id>/collapsed/', profiling_views.profile_collapsed, name='profile_collapsed'),
+    path('<str:profile_id>/flamegraph.json', profiling_views.profile_flamegraph, name='profile_flamegraph'),
+]
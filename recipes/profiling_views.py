@@ -0,0 +1,58 @@
+# recipes/profiling_views.py
+"""
+Staff-only viewer for the request profiles stored by RequestProfilerMiddleware.
+"""
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import Http404, HttpResponse, JsonResponse
+from django.shortcuts import render
+
+from .profiling import flame_graph_tree, list_profiles, load_profile
+
+
+def get_profile_or_404(profile_id):
+    data = load_profile(profile_id)
+    if data is None:
+        raise Http404('Profile not found.')
+    return data
+
+
+@staff_member_required
+def profile_list(request):
+    """
+    Lists the most recent stored profiles.
+    """
+    return render(request, 'recipes/profiling/profile_list.html', {'profiles': list_profiles()})
+
+
+@staff_member_required
+def profile_detail(request, profile_id):
+    """
+    Shows one profile: slowest functions, SQL statements and collapsed stacks.
+    """
+    profile = get_profile_or_404(profile_id)
+    stacks = sorted(profile.get('stacks', {}).items(), key=lambda item: item[1], reverse=True)
+    return render(request, 'recipes/profiling/profile_detail.html', {
+        'profile': profile,
+        'stacks': stacks,
+    })
+
+
+@staff_member_required
+def profile_collapsed(request, profile_id):
+    """
+    Collapsed stacks in the text format read by flamegraph.pl and speedscope.
+    """
+    profile = get_profile_or_404(profile_id)
+    lines = [f'{stack} {count}' for stack, count in profile.get('stacks', {}).items()]
+    response = HttpResponse('\n'.join(lines) + '\n', content_type='text/plain; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{profile_id}.folded"'
+    return response
+
+
+@staff_member_required
+def profile_flamegraph(request, profile_id):
+    """
+    Flame graph data as a nested {name, value, children} JSON tree.
+    """
+    profile = get_profile_or_404(profile_id)
+    return JsonResponse(flame_graph_tree(profile.get('stacks', {})))
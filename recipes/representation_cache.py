@@ -0,0 +1,72 @@
+# recipes/representation_cache.py
+"""
+Cache of serialized API representations, one entry per recipe version.
+
+Entries are keyed on (pk, updated_at), so a saved recipe simply gets a new
+key and stale entries are never served; they just age out of the cache. The
+key also includes the request's scheme and host, because the representation
+contains absolute image URLs.
+
+Lookups go through get_many/set_many, so resolving N recipes costs one cache
+round trip to read and at most one to write, whatever N is.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+
+KEY_PREFIX = 'recipes.representation'
+# Bump when RecipeSerializer's output changes, so old entries are not served
+KEY_VERSION = 1
+
+
+def get_cache():
+    return caches[getattr(settings, 'RECIPE_REPRESENTATION_CACHE', 'default')]
+
+
+def get_timeout():
+    return getattr(settings, 'RECIPE_REPRESENTATION_CACHE_TIMEOUT', 24 * 60 * 60)
+
+
+def cache_key(request, pk, updated_at):
+    """
+    Returns the cache key for one version of one recipe, as seen from this request's host.
+    """
+    origin = request.build_absolute_uri('/') if request is not None else ''
+    origin_digest = hashlib.md5(origin.encode()).hexdigest()[:12]
+    return f'{KEY_PREFIX}:{KEY_VERSION}:{origin_digest}:{pk}:{updated_at.timestamp():.6f}'
+
+
+def get_cached(request, versions):
+    """
+    Looks up the cached representations for {pk: updated_at}. Returns {pk: data} for the hits.
+    """
+    keys = {cache_key(request, pk, updated_at): pk for pk, updated_at in versions.items()}
+    found = get_cache().get_many(list(keys))
+    return {keys[key]: data for key, data in found.items()}
+
+
+def serialize_and_cache(request, instances, serializer_class, context):
+    """
+    Serializes the instances in one pass and stores the results. Returns {pk: data}.
+    """
+    data = serializer_class(instances, many=True, context=context).data
+    representations = {instance.pk: dict(item) for instance, item in zip(instances, data)}
+    get_cache().set_many(
+        {
+            cache_key(request, instance.pk, instance.updated_at): representations[instance.pk]
+            for instance in instances
+        },
+        timeout=get_timeout(),
+    )
+    return representations
+
+
+def cached_representation(request, instance, serializer_class, context):
+    """
+    Returns the representation of one instance, from the cache when possible.
+    """
+    hit = get_cached(request, {instance.pk: instance.updated_at})
+    if instance.pk in hit:
+        return hit[instance.pk]
+    return serialize_and_cache(request, [instance], serializer_class, context)[instance.pk]
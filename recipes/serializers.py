@@ -1,6 +1,7 @@
 # recipes/serializers.py
 from rest_framework import serializers
-from .models import Recipe
+from .models import Recipe, RecipeImageUpload
+from .uploads import get_max_upload_size
 
 class RecipeSerializer(serializers.ModelSerializer):
     """
@@ -32,4 +33,25 @@ class RecipeSerializer(serializers.ModelSerializer):
             elif obj.image_url:
                 return obj.image_url
         # Fallback if no request context or no image
-        return obj.get_image_display_url() # Use the model's method as a fallback
\ No newline at end of file
+        return obj.get_image_display_url() # Use the model's method as a fallback
+
+class RecipeImageUploadSerializer(serializers.ModelSerializer):
+    """
+    Serializer for a resumable image upload session.
+    The client sets recipe, filename and size; offset reports how many bytes were received.
+    """
+    class Meta:
+        model = RecipeImageUpload
+        fields = ['id', 'recipe', 'filename', 'size', 'offset', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'offset', 'created_at', 'updated_at']
+
+    def validate_size(self, value):
+        """
+        Rejects empty uploads and uploads larger than CHUNKED_UPLOAD_MAX_SIZE.
+        """
+        max_size = get_max_upload_size()
+        if value <= 0:
+            raise serializers.ValidationError("Size must be greater than zero.")
+        if value > max_size:
+            raise serializers.ValidationError(f"Size may not exceed {max_size} bytes.")
+        return value
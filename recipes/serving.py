@@ -0,0 +1,257 @@
+# recipes/serving.py
+"""
+Production serving of static files and uploaded media.
+
+Django's `static()` helper only works with DEBUG on and serves every file
+uncached. These views are meant to run with DEBUG off:
+
+- static files come from STATIC_ROOT (as built by collectstatic with
+  CompressedManifestStaticFilesStorage); precompressed .br/.gz variants are
+  picked from Accept-Encoding, and hashed names are marked immutable;
+- media files support ETags, conditional requests and HTTP Range requests, and
+  can be handed off to the front-end server with X-Sendfile/X-Accel-Redirect.
+
+Everything is configured from the SERVE_*/STATIC_FILES_*/MEDIA_* settings.
+"""
+import mimetypes
+import os
+import posixpath
+import re
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+from .storage import is_content_addressed_name
+
+# One year: content-addressed and hashed files never change under the same name
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# Preferred first: brotli compresses text assets better than gzip
+PRECOMPRESSED_ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# (manifest dict, set of its hashed names), see is_hashed_static_name()
+_hashed_names = (None, frozenset())
+
+
+def resolve_path(document_root, path):
+    """
+    Returns the absolute file path for `path` under `document_root`, or raises Http404.
+    """
+    path = posixpath.normpath(path).lstrip('/')
+    try:
+        full_path = safe_join(document_root, path)
+    except SuspiciousFileOperation:
+        raise Http404('Invalid path.')
+    if not os.path.isfile(full_path):
+        raise Http404('File not found.')
+    return full_path
+
+
+def make_etag(stat, token=None):
+    """
+    Builds a strong ETag from a stable token (e.g. a content digest) or from mtime and size.
+    """
+    if token:
+        return f'"{token}"'
+    return f'"{int(stat.st_mtime):x}-{stat.st_size:x}"'
+
+
+def parse_range(header, size):
+    """
+    Parses a single-range `Range: bytes=...` header.
+
+    Returns (start, end) inclusive, None if the header should be ignored
+    (missing, malformed or multi-range, in which case the full file is sent),
+    or raises ValueError if the range cannot be satisfied.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError('Empty suffix range.')
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError('Range not satisfiable.')
+    return start, min(end, size - 1)
+
+
+def range_iterator(file_obj, start, length):
+    """
+    Yields `length` bytes of file_obj starting at `start`, in fixed-size chunks.
+    """
+    try:
+        file_obj.seek(start)
+        remaining = length
+        while remaining > 0:
+            data = file_obj.read(min(STREAM_CHUNK_SIZE, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+    finally:
+        file_obj.close()
+
+
+def if_range_matches(request, etag, last_modified):
+    """
+    True if there is no If-Range header, or it still matches the current representation.
+    """
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == int(last_modified)
+
+
+def build_file_response(request, full_path, *, content_type, cache_control, etag_token=None,
+                        content_encoding=None, allow_ranges=True, offload_path=None):
+    """
+    Builds the response for one file: conditional requests (304/412), optional
+    sendfile offload, Range requests (206/416) or the full file (200).
+    """
+    stat = os.stat(full_path)
+    etag = make_etag(stat, etag_token)
+    if content_encoding:
+        # Different bytes for the same URL need a different validator
+        etag = f'{etag[:-1]}-{content_encoding}"'
+    last_modified = stat.st_mtime
+
+    response = get_conditional_response(request, etag=etag, last_modified=int(last_modified))
+    if response is None:
+        if offload_path is not None:
+            # The front-end server reads the file (and handles Range itself)
+            response = HttpResponse(content_type=content_type)
+            header = 'X-Accel-Redirect' if settings.MEDIA_SENDFILE_BACKEND == 'x-accel-redirect' else 'X-Sendfile'
+            response[header] = offload_path
+        else:
+            byte_range = None
+            if allow_ranges and if_range_matches(request, etag, last_modified):
+                try:
+                    byte_range = parse_range(request.headers.get('Range'), stat.st_size)
+                except ValueError:
+                    response = HttpResponse(status=416)
+                    response['Content-Range'] = f'bytes */{stat.st_size}'
+                    return response
+
+            if byte_range is None:
+                response = FileResponse(open(full_path, 'rb'), content_type=content_type)
+                response['Content-Length'] = str(stat.st_size)
+            else:
+                start, end = byte_range
+                length = end - start + 1
+                response = StreamingHttpResponse(
+                    range_iterator(open(full_path, 'rb'), start, length),
+                    status=206, content_type=content_type
+                )
+                response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+                response['Content-Length'] = str(length)
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = cache_control
+    if allow_ranges:
+        response['Accept-Ranges'] = 'bytes'
+    if content_encoding:
+        response['Content-Encoding'] = content_encoding
+    return response
+
+
+def guess_content_type(full_path):
+    content_type, encoding = mimetypes.guess_type(full_path)
+    return content_type or 'application/octet-stream'
+
+
+def is_hashed_static_name(path):
+    """
+    True if `path` is one of the hashed names recorded in the staticfiles manifest.
+    """
+    global _hashed_names
+    hashed_files = getattr(staticfiles_storage, 'hashed_files', None) or {}
+    # Rebuild the lookup set only when the storage loads a new manifest
+    if _hashed_names[0] is not hashed_files:
+        _hashed_names = (hashed_files, frozenset(hashed_files.values()))
+    return path in _hashed_names[1]
+
+
+@require_safe
+def serve_static(request, path, document_root=None):
+    """
+    Serves a collected static file, preferring a precompressed variant the client accepts.
+    """
+    document_root = document_root or settings.STATIC_ROOT
+    full_path = resolve_path(document_root, path)
+    content_type = guess_content_type(full_path)
+
+    if is_hashed_static_name(path):
+        cache_control = IMMUTABLE_CACHE_CONTROL
+    else:
+        cache_control = f'public, max-age={settings.STATIC_FILES_MAX_AGE}'
+
+    accept_encoding = request.headers.get('Accept-Encoding', '')
+    accepted = {token.split(';')[0].strip() for token in accept_encoding.split(',')}
+    served_path, content_encoding = full_path, None
+    for encoding, suffix in PRECOMPRESSED_ENCODINGS:
+        if encoding in accepted and os.path.isfile(full_path + suffix):
+            served_path, content_encoding = full_path + suffix, encoding
+            break
+
+    response = build_file_response(
+        request, served_path,
+        content_type=content_type,
+        cache_control=cache_control,
+        content_encoding=content_encoding,
+    )
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
+
+
+@require_safe
+def serve_media(request, path, document_root=None):
+    """
+    Serves an uploaded media file with ETags, Range support and optional
+    X-Sendfile/X-Accel-Redirect offload. Content-addressed files (whose name
+    changes whenever their content does) get far-future cache headers.
+    """
+    document_root = document_root or settings.MEDIA_ROOT
+    full_path = resolve_path(document_root, path)
+
+    etag_token = None
+    if is_content_addressed_name(path):
+        cache_control = IMMUTABLE_CACHE_CONTROL
+        # The digest in the name identifies the content exactly
+        etag_token = posixpath.splitext(posixpath.basename(path))[0]
+    else:
+        cache_control = f'public, max-age={settings.MEDIA_FILES_MAX_AGE}'
+
+    offload_path = None
+    if settings.MEDIA_SENDFILE_BACKEND == 'x-sendfile':
+        offload_path = full_path
+    elif settings.MEDIA_SENDFILE_BACKEND == 'x-accel-redirect':
+        offload_path = settings.MEDIA_ACCEL_REDIRECT_PREFIX.rstrip('/') + '/' + posixpath.normpath(path).lstrip('/')
+
+    return build_file_response(
+        request, full_path,
+        content_type=guess_content_type(full_path),
+        cache_control=cache_control,
+        etag_token=etag_token,
+        offload_path=offload_path,
+    )
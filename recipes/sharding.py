@@ -0,0 +1,636 @@
+# recipes/sharding.py
+"""
+Optional horizontal sharding of recipes across several SQLite databases.
+
+With RECIPE_SHARDS set to a list of database aliases (each one defined in
+DATABASES), Recipe rows, and the RecipeImageUpload rows that belong to them,
+are partitioned across those databases:
+
+- a recipe lives on the shard picked by a jump consistent hash of its id, so
+  changing the number of shards moves as few rows as possible (see
+  `manage.py rebalance_recipe_shards`);
+- ids are globally unique: they are handed out in blocks of
+  RECIPE_ID_BLOCK_SIZE from a ShardIdSequence row in the `default` database;
+- lookups by id go straight to the owning shard, while everything else
+  (lists, search, the admin) fans out to all shards in parallel threads and
+  the per-shard results, each already ordered by the database, are combined
+  with a k-way merge.
+
+With RECIPE_SHARDS empty (the default) none of this is active and recipes
+live in the `default` database as before.
+
+Titles are only unique per shard at the database level; across shards,
+uniqueness is checked by the (fan-out) form and serializer validation.
+"""
+import hashlib
+import heapq
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from itertools import groupby
+
+from django.apps import apps
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db import DatabaseError, IntegrityError, connections, models, transaction
+from django.db.models.aggregates import Count, Max, Min, Sum
+from django.db.models.query import (
+    FlatValuesListIterable, ModelIterable, NamedValuesListIterable, ValuesIterable, ValuesListIterable,
+)
+from django.db.models.utils import create_namedtuple_class
+
+COORDINATOR_DATABASE = 'default'
+RECIPE_ID_SEQUENCE = 'recipe'
+
+# Aggregates that can be combined from per-shard results
+COMBINABLE_AGGREGATES = {Min: min, Max: max, Sum: sum, Count: sum}
+
+
+def get_shard_aliases():
+    """
+    Returns the configured shard aliases, or an empty list if sharding is off.
+    """
+    return list(getattr(settings, 'RECIPE_SHARDS', None) or [])
+
+
+def is_sharding_enabled():
+    return bool(get_shard_aliases())
+
+
+def jump_hash(key, num_buckets):
+    """
+    Jump consistent hash (Lamping & Veach): maps a 64-bit key to one of
+    `num_buckets` buckets so that growing from N to N+1 buckets only moves
+    about 1/(N+1) of the keys, all of them to the new bucket.
+    """
+    bucket, jump = -1, 0
+    while jump < num_buckets:
+        bucket = jump
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        jump = int((bucket + 1) * (float(1 << 31) / float((key >> 33) + 1)))
+    return bucket
+
+
+def shard_for_key(key, aliases=None):
+    """
+    Returns the alias of the shard that owns a recipe id.
+    """
+    aliases = aliases if aliases is not None else get_shard_aliases()
+    digest = hashlib.blake2b(str(int(key)).encode(), digest_size=8).digest()
+    return aliases[jump_hash(int.from_bytes(digest, 'big'), len(aliases))]
+
+
+def shard_for_instance(instance, aliases=None):
+    """
+    Returns the owning shard of a sharded model instance, from its `shard_key` field.
+    """
+    key = getattr(instance, type(instance).shard_key)
+    return shard_for_key(key, aliases) if key is not None else None
+
+
+def is_sharded_model(model):
+    return getattr(model, 'shard_key', None) is not None
+
+
+_pinned = threading.local()
+
+
+@contextmanager
+def pinned_shard(alias):
+    """
+    Within the block, queries on sharded models go to `alias` instead of
+    fanning out, including queries made by Django itself without an instance
+    to route by (e.g. the admin's deletion collector).
+    """
+    previous = getattr(_pinned, 'alias', None)
+    _pinned.alias = alias
+    try:
+        yield
+    finally:
+        _pinned.alias = previous
+
+
+def get_pinned_shard():
+    return getattr(_pinned, 'alias', None)
+
+
+# Parallel fan-out
+
+_executor = None
+_executor_key = None
+_executor_lock = threading.Lock()
+
+
+def get_executor(size):
+    """
+    Returns this process's fan-out thread pool (recreated after a fork).
+    """
+    global _executor, _executor_key
+    key = (os.getpid(), size)
+    with _executor_lock:
+        if _executor_key != key:
+            _executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix='shard-fanout')
+            _executor_key = key
+    return _executor
+
+
+def _run_in_thread(func, alias):
+    try:
+        return func(alias)
+    finally:
+        connections[alias].close_if_unusable_or_obsolete()
+
+
+def run_on_shards(func, aliases=None):
+    """
+    Calls func(alias) for every shard and returns the results in shard order.
+
+    The calls run in parallel threads, except while this thread is inside a
+    transaction on one of the shards: other threads could not see its
+    uncommitted writes, so the shards are then queried one after another.
+    """
+    aliases = aliases if aliases is not None else get_shard_aliases()
+    if len(aliases) < 2 or any(connections[alias].in_atomic_block for alias in aliases):
+        return [func(alias) for alias in aliases]
+    executor = get_executor(len(aliases))
+    futures = [executor.submit(_run_in_thread, func, alias) for alias in aliases]
+    return [future.result() for future in futures]
+
+
+# Merging ordered per-shard results
+
+def get_ordering(queryset):
+    """
+    Returns the queryset's ordering as [(name, descending)], or None if the
+    ordering cannot be reproduced in Python (expressions, random order).
+    """
+    query = queryset.query
+    if query.order_by:
+        ordering = query.order_by
+    elif query.default_ordering:
+        ordering = query.get_meta().ordering
+    else:
+        return []
+    result = []
+    for name in ordering:
+        if not isinstance(name, str) or name == '?' or '__' in name:
+            return None
+        result.append((name[1:], True) if name.startswith('-') else (name, False))
+    return result
+
+
+def row_getter(queryset, name):
+    """
+    Returns a function that reads field `name` from one result row of the
+    queryset. Raises KeyError if a values()/values_list() row doesn't hold it.
+    """
+    model = queryset.model
+    if name == 'pk':
+        name = model._meta.pk.name
+    try:
+        field = model._meta.get_field(name)
+    except FieldDoesNotExist:
+        field = None  # An annotation
+    iterable_class = queryset._iterable_class
+    if issubclass(iterable_class, ModelIterable):
+        attname = field.attname if field else name
+        return lambda row: getattr(row, attname)
+    query = queryset.query
+    names = list(queryset._fields or [*query.extra_select, *query.values_select, *query.annotation_select])
+    # values('pk') / values('author') name their columns as asked, values() uses attnames
+    candidates = [name]
+    if field:
+        candidates += [field.attname, 'pk'] if field.primary_key else [field.attname]
+    key = next((candidate for candidate in candidates if candidate in names), None)
+    if key is None:
+        raise KeyError(name)
+    if issubclass(iterable_class, ValuesIterable):
+        return lambda row: row[key]
+    if issubclass(iterable_class, FlatValuesListIterable):
+        return lambda row: row
+    if issubclass(iterable_class, ValuesListIterable):
+        index = names.index(key)
+        return lambda row: row[index]
+    raise KeyError(name)
+
+
+def sort_key(value):
+    # SQLite sorts NULLs first
+    return (value is not None, value)
+
+
+def merge_ordered(queryset, results):
+    """
+    Combines per-shard result lists (or iterators), each sorted by the
+    queryset's ordering, into one sorted iterable.
+
+    When all ordering keys go in the same direction this is a lazy k-way
+    merge; mixed directions fall back to sorting the combined rows.
+    """
+    ordering = get_ordering(queryset)
+    if not ordering:
+        # Unordered (or ordered by something Python can't reproduce): just concatenate
+        return (row for rows in results for row in rows)
+    try:
+        getters = [(row_getter(queryset, name), descending) for name, descending in ordering]
+    except KeyError as exc:
+        raise NotImplementedError(
+            f'Shard results cannot be merged on {exc.args[0]!r}, which the query does not select.'
+        ) from None
+
+    directions = {descending for getter, descending in getters}
+    if len(directions) == 1:
+        def key(row):
+            return tuple(sort_key(getter(row)) for getter, descending in getters)
+        return heapq.merge(*results, key=key, reverse=directions.pop())
+
+    rows = [row for shard_rows in results for row in shard_rows]
+    for getter, descending in reversed(getters):
+        rows.sort(key=lambda row: sort_key(getter(row)), reverse=descending)
+    return iter(rows)
+
+
+def drop_duplicates(rows):
+    """
+    Drops adjacent duplicates, for distinct() values queries merged from several shards.
+    """
+    return (row for row, group in groupby(rows))
+
+
+class ShardedQuerySet(models.QuerySet):
+    """
+    QuerySet for sharded models.
+
+    When sharding is enabled and the queryset is not tied to one database
+    (by using(), or by a related instance), it is evaluated on every shard and
+    the results are merged: iteration, slicing, count(), exists(),
+    aggregate() (Min, Max, Sum and Count), update() and delete() all work
+    across shards. get() by id and create() go to the owning shard only.
+    Without sharding it is a plain QuerySet.
+    """
+
+    def _is_fanout(self):
+        if self._db is not None or self._hints.get('instance') is not None or get_pinned_shard():
+            return False
+        return is_sharding_enabled()
+
+    def _with_ordering_fields(self):
+        """
+        Returns the queryset each shard evaluates. A values()/values_list()
+        query that leaves out a field it is ordered by selects it as well, or
+        its shard results could not be merged; _strip_ordering_fields()
+        removes it again.
+        """
+        ordering = get_ordering(self)
+        if not ordering or not self._fields or issubclass(self._iterable_class, ModelIterable):
+            return self._chain()
+        missing = []
+        for name, descending in ordering:
+            try:
+                row_getter(self, name)
+            except KeyError:
+                missing.append(name)
+        if not missing:
+            return self._chain()
+        clone = self._values(*self._fields, *missing)
+        if issubclass(self._iterable_class, (FlatValuesListIterable, ValuesListIterable)):
+            clone._iterable_class = ValuesListIterable
+        return clone
+
+    def _strip_ordering_fields(self, rows, shape):
+        if shape._fields == self._fields:
+            return rows
+        fields = self._fields
+        if issubclass(self._iterable_class, ValuesIterable):
+            return ({name: row[name] for name in fields} for row in rows)
+        if issubclass(self._iterable_class, FlatValuesListIterable):
+            return (row[0] for row in rows)
+        if issubclass(self._iterable_class, NamedValuesListIterable):
+            tuple_class = create_namedtuple_class(*fields)
+            return (tuple_class(*row[:len(fields)]) for row in rows)
+        return (row[:len(fields)] for row in rows)
+
+    def _shard_clone(self, alias, keep_limits=False, shape=None):
+        # `shape` is the _with_ordering_fields() queryset when rows are merged
+        clone = (self if shape is None else shape)._chain()
+        clone._db = alias
+        if not keep_limits:
+            high = clone.query.high_mark
+            clone.query.clear_limits()
+            if high is not None:
+                # Every shard could hold all of the first `high` rows
+                clone.query.set_limits(0, high)
+        return clone
+
+    def _merge(self, shape, shard_results):
+        rows = merge_ordered(shape, shard_results)
+        if self.query.distinct and not issubclass(self._iterable_class, ModelIterable):
+            rows = drop_duplicates(rows)
+        return self._strip_ordering_fields(rows, shape)
+
+    def _fetch_all(self):
+        if self._result_cache is None and self._is_fanout():
+            shape = self._with_ordering_fields()
+            shard_results = run_on_shards(lambda alias: list(self._shard_clone(alias, shape=shape)))
+            low, high = self.query.low_mark, self.query.high_mark
+            self._result_cache = list(self._merge(shape, shard_results))[low:high]
+            self._prefetch_done = True  # Each shard prefetched its own rows
+        super()._fetch_all()
+
+    def iterator(self, chunk_size=None):
+        if not self._is_fanout():
+            return super().iterator(chunk_size)
+        if self.query.is_sliced or self.query.distinct:
+            return iter(self._chain())
+        # Streams every shard at once and merges lazily
+        shape = self._with_ordering_fields()
+        return self._merge(shape, [
+            self._shard_clone(alias, shape=shape).iterator(chunk_size) for alias in get_shard_aliases()
+        ])
+
+    def count(self):
+        if self._result_cache is not None or not self._is_fanout():
+            return super().count()
+        if self.query.is_sliced:
+            return len(self._chain())
+        return sum(run_on_shards(lambda alias: self._shard_clone(alias).count()))
+
+    def exists(self):
+        if self._result_cache is not None or not self._is_fanout():
+            return super().exists()
+        return any(run_on_shards(lambda alias: self._shard_clone(alias).exists()))
+
+    def aggregate(self, *args, **kwargs):
+        if not self._is_fanout():
+            return super().aggregate(*args, **kwargs)
+        for arg in args:
+            kwargs[arg.default_alias] = arg
+        combiners = {}
+        for name, expression in kwargs.items():
+            combine = COMBINABLE_AGGREGATES.get(type(expression))
+            if combine is None or getattr(expression, 'distinct', False):
+                raise NotImplementedError(
+                    f'{type(expression).__name__} cannot be combined across shards.'
+                )
+            combiners[name] = combine
+        shard_results = run_on_shards(lambda alias: self._shard_clone(alias).aggregate(**kwargs))
+        result = {}
+        for name, combine in combiners.items():
+            values = [values[name] for values in shard_results if values[name] is not None]
+            result[name] = combine(values) if values else (0 if combine is sum else None)
+        return result
+
+    def _shard_key_lookups(self):
+        key_field = next(f for f in self.model._meta.concrete_fields if f.attname == self.model.shard_key)
+        lookups = {key_field.name, key_field.attname}
+        if key_field.primary_key:
+            lookups.add('pk')
+        return lookups | {f'{lookup}__exact' for lookup in lookups}
+
+    def get(self, *args, **kwargs):
+        if self._is_fanout() and not args and len(kwargs) == 1:
+            (lookup, value), = kwargs.items()
+            if lookup in self._shard_key_lookups():
+                try:
+                    alias = shard_for_key(value)
+                except (TypeError, ValueError):
+                    alias = None  # Not a valid id: let the fan-out query raise as usual
+                if alias is not None:
+                    return self.using(alias).get(**kwargs)
+        return super().get(*args, **kwargs)
+
+    def create(self, **kwargs):
+        if not self._is_fanout():
+            return super().create(**kwargs)
+        obj = self.model(**kwargs)
+        # Model.save() asks the router, which picks the owning shard
+        obj.save(force_insert=True)
+        return obj
+
+    def bulk_create(self, objs, *args, **kwargs):
+        if not self._is_fanout():
+            return super().bulk_create(objs, *args, **kwargs)
+        objs = list(objs)
+        by_shard = {}
+        for obj in objs:
+            if obj.pk is None and self.model._meta.pk.attname == self.model.shard_key:
+                obj.pk = allocate_id(RECIPE_ID_SEQUENCE)
+            by_shard.setdefault(shard_for_instance(obj), []).append(obj)
+        for alias, shard_objs in by_shard.items():
+            self.using(alias).bulk_create(shard_objs, *args, **kwargs)
+        return objs
+
+    def update(self, **kwargs):
+        if not self._is_fanout():
+            return super().update(**kwargs)
+        return sum(run_on_shards(lambda alias: self._shard_clone(alias, keep_limits=True).update(**kwargs)))
+
+    update.alters_data = True
+
+    def delete(self):
+        if not self._is_fanout():
+            return super().delete()
+        total, per_model = 0, {}
+        for deleted, counts in run_on_shards(lambda alias: self._shard_clone(alias, keep_limits=True).delete()):
+            total += deleted
+            for label, count in counts.items():
+                per_model[label] = per_model.get(label, 0) + count
+        return total, per_model
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+
+# Id allocation
+
+class IdBlockAllocator:
+    """
+    Hands out globally unique ids from blocks reserved in the coordinator database.
+
+    Each process reserves `block_size` ids at a time with one UPDATE on the
+    sequence row, then hands them out locally, so allocating an id rarely
+    touches the database. Ids are unique but, across processes, not ordered.
+    """
+
+    def __init__(self, sequence, block_size):
+        self.sequence = sequence
+        self.block_size = block_size
+        self._next = 0
+        self._end = 0
+        self._lock = threading.Lock()
+
+    def allocate(self):
+        with self._lock:
+            if self._next >= self._end:
+                self._next, self._end = self._reserve_block()
+            value = self._next
+            self._next += 1
+            return value
+
+    def _reserve_block(self):
+        # Reserved on a connection of its own and committed straight away. Run on
+        # the shared connection it would join any transaction the caller has open
+        # on the coordinator (e.g. the admin's change form): if that rolled back,
+        # the reservation would be undone while this process keeps handing out the
+        # block, and another process would be given the same ids.
+        connection = connections.create_connection(COORDINATOR_DATABASE)
+        try:
+            connection.set_autocommit(False)
+            while True:
+                block = self._try_reserve(connection)
+                if block is not None:
+                    return block
+        finally:
+            connection.close()
+
+    def _try_reserve(self, connection):
+        """
+        Reserves the next block in one transaction; returns None if another
+        process created the sequence row concurrently (try again).
+        """
+        ShardIdSequence = apps.get_model('recipes', 'ShardIdSequence')
+        quote_name = connection.ops.quote_name
+        table = quote_name(ShardIdSequence._meta.db_table)
+        name = quote_name(ShardIdSequence._meta.get_field('name').column)
+        next_value = quote_name(ShardIdSequence._meta.get_field('next_value').column)
+        try:
+            with connection.cursor() as cursor:
+                # The UPDATE takes SQLite's write lock, so the read below can't race
+                cursor.execute(
+                    f'UPDATE {table} SET {next_value} = {next_value} + %s WHERE {name} = %s',
+                    [self.block_size, self.sequence],
+                )
+                if cursor.rowcount:
+                    cursor.execute(f'SELECT {next_value} FROM {table} WHERE {name} = %s', [self.sequence])
+                    end = cursor.fetchone()[0]
+                    connection.commit()
+                    return end - self.block_size, end
+            connection.rollback()
+            start = self._initial_value()
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'INSERT INTO {table} ({name}, {next_value}) VALUES (%s, %s)',
+                    [self.sequence, start + self.block_size],
+                )
+            connection.commit()
+            return start, start + self.block_size
+        except IntegrityError:
+            connection.rollback()
+            return None
+        except BaseException:
+            connection.rollback()
+            raise
+
+    def _initial_value(self):
+        # Continue after the highest id already stored, including recipes still
+        # in an unsharded default database that have not been rebalanced yet
+        Recipe = apps.get_model('recipes', 'Recipe')
+        highest = Recipe.objects.aggregate(highest=Max('pk'))['highest'] or 0
+        if COORDINATOR_DATABASE not in get_shard_aliases():
+            try:
+                with transaction.atomic(using=COORDINATOR_DATABASE):
+                    legacy = Recipe.objects.using(COORDINATOR_DATABASE).aggregate(highest=Max('pk'))['highest']
+            except DatabaseError:
+                legacy = None  # No recipe table in the default database
+            highest = max(highest, legacy or 0)
+        return highest + 1
+
+
+_allocators = {}
+_allocators_lock = threading.Lock()
+
+
+def allocate_id(sequence):
+    """
+    Returns a new globally unique id from the named sequence.
+    """
+    block_size = getattr(settings, 'RECIPE_ID_BLOCK_SIZE', 100)
+    key = (os.getpid(), sequence, block_size)
+    with _allocators_lock:
+        allocator = _allocators.get(key)
+        if allocator is None:
+            allocator = _allocators[key] = IdBlockAllocator(sequence, block_size)
+    return allocator.allocate()
+
+
+def reset_id_allocators():
+    """
+    Forgets the reserved blocks, e.g. after the sequence table was flushed.
+    """
+    with _allocators_lock:
+        _allocators.clear()
+
+
+# Routing
+
+class RecipeShardRouter:
+    """
+    Database router for sharded models (those with a `shard_key`).
+
+    Instances are routed to their owning shard. Querysets without an instance
+    are left to ShardedQuerySet, which fans them out. Only the shards get the
+    sharded tables, and only `default` gets everything else.
+    """
+
+    def _db_for_instance(self, model, hints):
+        if not is_sharding_enabled():
+            return None
+        instance = hints.get('instance')
+        if instance is None:
+            return get_pinned_shard() if is_sharded_model(model) else None
+        if instance._state.db is not None:
+            return instance._state.db
+        if is_sharded_model(type(instance)):
+            return shard_for_instance(instance)
+        return None
+
+    def db_for_read(self, model, **hints):
+        return self._db_for_instance(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self._db_for_instance(model, hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if not is_sharding_enabled():
+            return None
+        if is_sharded_model(type(obj1)) and is_sharded_model(type(obj2)):
+            return obj1._state.db == obj2._state.db
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        shards = get_shard_aliases()
+        if not shards:
+            return None
+        if model_name is not None:
+            try:
+                model = apps.get_model(app_label, model_name)
+            except LookupError:
+                model = None
+            if model is not None and is_sharded_model(model):
+                return db in shards
+        if db in shards:
+            return db == COORDINATOR_DATABASE
+        return None
+
+
+def migrate_shards(aliases=None, verbosity=0):
+    """
+    Creates or updates the sharded tables on every shard.
+    """
+    from django.core.management import call_command
+    for alias in aliases if aliases is not None else get_shard_aliases():
+        call_command('migrate', database=alias, verbosity=verbosity, interactive=False)
+
+
+def route_to_shard(queryset, key):
+    """
+    Narrows a queryset to the shard owning `key`, when sharding is enabled.
+    """
+    if key is None or not is_sharding_enabled():
+        return queryset
+    try:
+        alias = shard_for_key(key)
+    except (TypeError, ValueError):
+        return queryset  # Not a valid id: the lookup will 404 on its own
+    return queryset.using(alias)
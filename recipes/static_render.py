@@ -0,0 +1,253 @@
+# recipes/static_render.py
+"""
+Pre-rendering of the public recipe pages into static HTML files.
+
+Every list page and every detail page is rendered through the real
+RecipeListView / RecipeDetailView (and therefore the real templates), so the
+files on disk are byte-for-byte what an anonymous visitor would get from a
+live request. A JSON build manifest remembers which version of each page was
+written, which lets later builds re-render only the pages whose recipes
+changed.
+"""
+import hashlib
+import json
+import os
+from functools import wraps
+from pathlib import Path
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.http import FileResponse, Http404
+from django.urls import reverse
+
+from .models import Recipe
+from .views import RecipeDetailView, RecipeListView
+
+MANIFEST_NAME = 'manifest.json'
+MANIFEST_VERSION = 1
+
+
+def get_output_root():
+    """
+    Returns the directory the pre-rendered pages are written to.
+    """
+    return Path(getattr(settings, 'STATIC_RENDER_ROOT', settings.BASE_DIR / 'prerendered'))
+
+
+def list_page_path(page_number):
+    """
+    Relative output path for a list page. Page 1 is the bare list URL.
+    """
+    if page_number == 1:
+        return 'recipes/index.html'
+    return f'recipes/page/{page_number}.html'
+
+
+def detail_page_path(pk):
+    """
+    Relative output path for a recipe detail page.
+    """
+    return f'recipes/{pk}/index.html'
+
+
+def build_page_plan():
+    """
+    Works out every page the site currently has, together with a signature
+    describing the data shown on it.
+
+    Returns a dict mapping relative output path -> (kind, key, signature),
+    where kind is 'list' or 'detail' and key is the page number or recipe pk.
+    A page only needs re-rendering when its signature changes.
+    """
+    # Only fetch what the signatures need, in the same order the list view uses
+    rows = list(Recipe.objects.order_by(*Recipe._meta.ordering).values_list('pk', 'updated_at'))
+    plan = {}
+
+    for pk, updated_at in rows:
+        plan[detail_page_path(pk)] = ('detail', pk, updated_at.isoformat())
+
+    paginator = Paginator(rows, RecipeListView.paginate_by, allow_empty_first_page=True)
+    for page_number in paginator.page_range:
+        page_rows = paginator.page(page_number).object_list
+        digest = hashlib.sha1(f'pages={paginator.num_pages}'.encode())
+        for pk, updated_at in page_rows:
+            digest.update(f'|{pk}:{updated_at.isoformat()}'.encode())
+        plan[list_page_path(page_number)] = ('list', page_number, digest.hexdigest())
+
+    return plan
+
+
+def render_page(kind, key):
+    """
+    Renders a single page through its view and returns the HTML bytes.
+    """
+    # Imported here: recipes.urls imports this module, and django.test is
+    # slow to import for a worker that only serves pre-rendered files
+    from django.test import RequestFactory
+    factory = RequestFactory()
+    if kind == 'list':
+        params = {'page': key} if key != 1 else {}
+        request = factory.get(reverse('recipes:recipe_list'), params)
+        response = RecipeListView.as_view()(request)
+    else:
+        request = factory.get(reverse('recipes:recipe_detail', args=[key]))
+        response = RecipeDetailView.as_view()(request, pk=key)
+
+    response.render()
+    return response.content
+
+
+def write_atomic(path, content):
+    """
+    Writes bytes to path via a temporary file so readers never see a partial page.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f'.{path.name}.{os.getpid()}.tmp')
+    with open(tmp_path, 'wb') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+def render_batch(output_root, jobs):
+    """
+    Renders and writes a batch of (relative_path, kind, key) jobs.
+    Returns the relative paths that were written (a recipe deleted mid-build is skipped).
+    """
+    written = []
+    for rel_path, kind, key in jobs:
+        try:
+            content = render_page(kind, key)
+        except Http404:
+            continue
+        write_atomic(Path(output_root) / rel_path, content)
+        written.append(rel_path)
+    return written
+
+
+def load_manifest(output_root):
+    """
+    Reads the build manifest, returning an empty one if it is missing or stale.
+    """
+    try:
+        with open(Path(output_root) / MANIFEST_NAME) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if manifest.get('version') != MANIFEST_VERSION:
+        return {}
+    return manifest.get('pages', {})
+
+
+def save_manifest(output_root, pages):
+    content = json.dumps({'version': MANIFEST_VERSION, 'pages': pages}, indent=2, sort_keys=True)
+    write_atomic(Path(output_root) / MANIFEST_NAME, content.encode())
+
+
+def build_static_site(output_root=None, full=False, workers=1, batch_size=50):
+    """
+    Pre-renders the site into output_root.
+
+    With full=False only pages whose signature differs from the previous
+    manifest (or whose file went missing) are rendered; full=True renders
+    every page. Either way, pages in the previous manifest that no longer
+    exist are removed. Rendering is spread across `workers` processes.
+
+    Returns a dict with the lists of 'rendered', 'skipped' and 'removed' paths.
+    """
+    output_root = Path(output_root or get_output_root())
+    output_root.mkdir(parents=True, exist_ok=True)
+
+    previous = load_manifest(output_root)
+    plan = build_page_plan()
+
+    jobs = []
+    skipped = set()
+    for rel_path, (kind, key, signature) in plan.items():
+        if not full and previous.get(rel_path) == signature and (output_root / rel_path).exists():
+            skipped.add(rel_path)
+        else:
+            jobs.append((rel_path, kind, key))
+
+    rendered = []
+    if jobs:
+        if workers <= 1:
+            rendered = render_batch(output_root, jobs)
+        else:
+            from concurrent.futures import ProcessPoolExecutor
+
+            from . import static_render_worker
+            # Forked workers must not share the parent's database connections
+            connections.close_all()
+            batches = [jobs[i:i + batch_size] for i in range(0, len(jobs), batch_size)]
+            pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=static_render_worker.get_mp_context(),
+                initializer=static_render_worker.init_worker,
+                initargs=(settings.SETTINGS_MODULE,),
+            )
+            with pool:
+                for written in pool.map(static_render_worker.render_batch, [output_root] * len(batches), batches):
+                    rendered.extend(written)
+
+    # Drop pages for recipes (or list pages) that no longer exist
+    removed = []
+    for rel_path in set(previous) - set(plan):
+        try:
+            (output_root / rel_path).unlink()
+        except FileNotFoundError:
+            pass
+        removed.append(rel_path)
+
+    rendered_set = set(rendered)
+    pages = {
+        rel_path: signature
+        for rel_path, (kind, key, signature) in plan.items()
+        if rel_path in rendered_set or rel_path in skipped
+    }
+    save_manifest(output_root, pages)
+
+    return {'rendered': sorted(rendered), 'skipped': sorted(skipped), 'removed': sorted(removed)}
+
+
+def resolve_prerendered_path(request, view_kwargs):
+    """
+    Maps an incoming request to the pre-rendered file that would answer it,
+    or returns None if the request has to be rendered live.
+    """
+    if 'pk' in view_kwargs:
+        if request.GET:
+            return None
+        return detail_page_path(view_kwargs['pk'])
+
+    # List view: only plain pagination is pre-rendered, searches are always live
+    if set(request.GET) - {'page'}:
+        return None
+    page = request.GET.get('page', '1')
+    if not page.isdigit() or int(page) < 1:
+        return None
+    return list_page_path(int(page))
+
+
+def serve_prerendered(view):
+    """
+    View decorator that answers anonymous GET/HEAD requests from the
+    pre-rendered files when STATIC_RENDER_SERVE is enabled, falling back to
+    the wrapped view (live rendering) when no file is available.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if (
+            getattr(settings, 'STATIC_RENDER_SERVE', False)
+            and request.method in ('GET', 'HEAD')
+            and not getattr(getattr(request, 'user', None), 'is_authenticated', False)
+        ):
+            rel_path = resolve_prerendered_path(request, kwargs)
+            if rel_path is not None:
+                file_path = get_output_root() / rel_path
+                if file_path.is_file():
+                    response = FileResponse(open(file_path, 'rb'), content_type='text/html; charset=utf-8')
+                    response['X-Prerendered'] = '1'
+                    return response
+        return view(request, *args, **kwargs)
+    return wrapper
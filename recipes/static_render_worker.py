@@ -0,0 +1,42 @@
+# recipes/static_render_worker.py
+"""
+Process pool entry points for parallel static rendering.
+
+Workers started with `spawn` or `forkserver` (Windows, macOS, newer Linux
+Pythons) import the initializer and the task function before Django is set
+up, so this module must not import models, views or anything else that needs
+the app registry; the rendering code is imported once setup has run.
+"""
+import multiprocessing
+import os
+
+
+def get_mp_context():
+    """
+    Forked workers inherit the loaded project and start fastest; where fork is
+    not available, workers are spawned and set Django up in init_worker().
+    """
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    return multiprocessing.get_context('spawn')
+
+
+def init_worker(settings_module):
+    """
+    Process pool initializer: make sure Django is set up and that no database
+    connection inherited from the parent process is reused.
+    """
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    import django
+    django.setup()
+    from django.db import connections
+    for conn in connections.all(initialized_only=True):
+        conn.close()
+
+
+def render_batch(output_root, jobs):
+    """
+    Task function: renders a batch of jobs with static_render.render_batch().
+    """
+    from .static_render import render_batch
+    return render_batch(output_root, jobs)
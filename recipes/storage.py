@@ -0,0 +1,206 @@
+# recipes/storage.py
+"""
+Storage backends: content-addressed storage for recipe images, and the
+precompressing manifest storage used for static files.
+
+Recipe images are named after the SHA-256 digest of their bytes, computed while the
+upload streams to disk, so the same image uploaded twice is stored once and
+both recipes simply reference the same name. Because a name can never point
+to different content, those files are safe to serve with far-future,
+immutable cache headers.
+"""
+import gzip
+import hashlib
+import os
+import re
+import tempfile
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+
+try:
+    import brotli  # Optional: only needed for .br precompressed static files
+except ImportError:
+    brotli = None
+
+# Matches the names this storage generates: <dir>/<64 hex chars>.<ext>
+CONTENT_ADDRESSED_NAME_RE = re.compile(r'(^|/)[0-9a-f]{64}(\.[a-z0-9]{1,10})?$')
+
+HASH_CHUNK_SIZE = 64 * 1024
+
+
+def is_content_addressed_name(name):
+    """
+    Returns True if `name` was generated by ContentAddressedStorage.
+    """
+    return bool(CONTENT_ADDRESSED_NAME_RE.search(name or ''))
+
+
+def hash_file(file_obj):
+    """
+    Streams a binary file object and returns its SHA-256 hex digest.
+    """
+    digest = hashlib.sha256()
+    for data in iter(lambda: file_obj.read(HASH_CHUNK_SIZE), b''):
+        digest.update(data)
+    return digest.hexdigest()
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    FileSystemStorage that stores each distinct file once, under its digest.
+
+    Since one file can be shared by several recipes, delete() leaves the file
+    in place; unreferenced files are removed by `manage.py gc_recipe_images`.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # The final name is chosen in _save() from the content, never by adding a random suffix
+        return name
+
+    def content_addressed_name(self, name, digest):
+        """
+        Builds the storage name for `digest`, keeping the directory and extension of `name`.
+        """
+        directory = os.path.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        if not re.fullmatch(r'\.[a-z0-9]{1,10}', extension):
+            extension = ''
+        return os.path.join(directory, f'{digest}{extension}')
+
+    def _reuse_existing(self, name):
+        """
+        Returns True if `name` is already stored. Also bumps its mtime, so that
+        gc_recipe_images --min-age spares a blob that an upload has just reused
+        while a collection is running.
+        """
+        try:
+            os.utime(self.path(name))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def _save(self, name, content):
+        directory = os.path.dirname(self.path(name))
+        os.makedirs(directory, exist_ok=True)
+
+        if hasattr(content, 'temporary_file_path'):
+            # Already on disk (large upload): hash it in place, then move it
+            source_path = content.temporary_file_path()
+            with open(source_path, 'rb') as f:
+                digest = hash_file(f)
+            final_name = self.content_addressed_name(name, digest)
+            if not self._reuse_existing(final_name):
+                try:
+                    file_move_safe(source_path, self.path(final_name))
+                except FileExistsError:
+                    pass  # Someone stored the same content concurrently
+                else:
+                    if self.file_permissions_mode is not None:
+                        os.chmod(self.path(final_name), self.file_permissions_mode)
+            return final_name
+
+        # Hash while streaming into a temp file next to the destination
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.upload-')
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    tmp.write(chunk)
+            final_name = self.content_addressed_name(name, digest.hexdigest())
+            if self._reuse_existing(final_name):
+                os.remove(tmp_path)
+            else:
+                if self.file_permissions_mode is not None:
+                    os.chmod(tmp_path, self.file_permissions_mode)
+                os.replace(tmp_path, self.path(final_name))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return final_name
+
+    def delete(self, name):
+        """
+        No-op: the file may be referenced by other recipes. See gc_recipe_images.
+        """
+
+    def delete_blob(self, name):
+        """
+        Actually removes a stored file. Only the garbage collector should call this.
+        """
+        super().delete(name)
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Static files storage used by collectstatic in production.
+
+    On top of Django's hashed manifest names (app.css -> app.3f2a9c.css), it
+    writes gzip and, if the optional `brotli` package is installed, brotli
+    variants of compressible files next to the originals (app.3f2a9c.css.gz,
+    app.3f2a9c.css.br), so the file server never compresses at request time.
+    """
+    compress_extensions = ('.css', '.js', '.mjs', '.json', '.svg', '.html', '.txt', '.xml', '.map', '.md')
+    # Variants that save less than this fraction of the original are not kept
+    min_compression_ratio = 0.95
+
+    def __init__(self, *args, manifest_fallback=False, **kwargs):
+        # Serve plain names for files missing from the manifest (collectstatic has not
+        # run). Only meant for development: in production a missing manifest must fail
+        # loudly rather than silently serve unhashed, short-cached URLs.
+        self.manifest_fallback = manifest_fallback
+        super().__init__(*args, **kwargs)
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            if not self.manifest_fallback:
+                raise
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        to_compress = set()
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            if not isinstance(processed, Exception):
+                to_compress.add(name)
+                if hashed_name:
+                    to_compress.add(hashed_name)
+            yield name, hashed_name, processed
+
+        if dry_run:
+            return
+        for name in sorted(to_compress):
+            if name.lower().endswith(self.compress_extensions):
+                self.write_compressed_variants(name)
+
+    def write_compressed_variants(self, name):
+        """
+        Writes name.gz (and name.br when brotli is available) for a stored file.
+        """
+        path = self.path(name)
+        with open(path, 'rb') as f:
+            data = f.read()
+        if not data:
+            return
+
+        variants = [('.gz', lambda raw: gzip.compress(raw, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            variants.append(('.br', lambda raw: brotli.compress(raw, quality=11)))
+
+        for suffix, compress in variants:
+            compressed = compress(data)
+            if len(compressed) >= len(data) * self.min_compression_ratio:
+                continue
+            with open(path + suffix, 'wb') as f:
+                f.write(compressed)
+
+
+def recipe_image_storage():
+    """
+    Storage used by Recipe.image. A callable keeps the migration free of storage arguments.
+    """
+    return ContentAddressedStorage()
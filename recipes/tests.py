@@ -1,9 +1,41 @@
+import gzip
+import hashlib
+import json
+import multiprocessing
+import os
 import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO, StringIO
+from unittest import mock
 from PIL import Image # Pillow is needed for creating dummy images
-from django.test import TestCase, Client
-from django.urls import reverse
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import DatabaseError, IntegrityError, connection, connections, transaction
+from django.db.models import Max
+from django.test import TestCase, TransactionTestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path, resolve, reverse
+from django.utils import timezone
 from django.core.files.uploadedfile import SimpleUploadedFile
-from .models import Recipe
+from .admission import get_admission_controller
+from .fast_boot import lazy_path, warm_up
+from .models import Recipe, RecipeImageUpload
+from .profiling import flame_graph_tree, load_profile, make_profile_token
+from .representation_cache import get_cache
+from .serializers import RecipeSerializer
+from .sharding import RECIPE_ID_SEQUENCE, allocate_id, jump_hash, migrate_shards, reset_id_allocators, shard_for_key
+from .static_render import build_static_site
+from .static_render_worker import init_worker, render_batch
+from .storage import CompressedManifestStaticFilesStorage
+from .uploads import get_upload_temp_dir, upload_lock
+from .write_coalescer import WriteCoalescer
 
 class RecipeModelTest(TestCase):
     """
@@ -67,7 +99,8 @@ class RecipeModelTest(TestCase):
         self.assertEqual(self.recipe.steps, "1. Cook chicken. 2. Add spices. 3. Simmer.")
         self.assertIsNotNone(self.recipe.created_at)
         self.assertIsNotNone(self.recipe.updated_at)
-        self.assertIn('test_image', self.recipe.image.name)
+        # Images are stored under the SHA-256 digest of their content
+        self.assertTrue(self.recipe.image.name.startswith('recipe_images/'))
         self.assertTrue(self.recipe.image.name.endswith('.jpg'))
         self.assertIsNone(self.recipe.image_url) # Should be None as image was uploaded
 
@@ -89,7 +122,7 @@ class RecipeModelTest(TestCase):
         Test the get_image_display_url method's logic.
         """
         # Case 1: Image uploaded
-        self.assertIn('test_image', self.recipe.get_image_display_url())
+        self.assertEqual(self.recipe.get_image_display_url(), self.recipe.image.url)
         self.assertIn('.jpg', self.recipe.get_image_display_url())
 
         # Case 2: No image, but image_url provided
@@ -293,4 +326,1102 @@ class RecipeViewTest(TestCase):
         self.assertEqual(response.status_code, 302) # Redirects on success
         self.assertEqual(Recipe.objects.count(), initial_recipe_count - 1) # One less recipe
         self.assertFalse(Recipe.objects.filter(pk=self.recipe1.pk).exists()) # Recipe should be deleted
-        self.assertRedirects(response, self.list_url) # Redirects to list view
\ No newline at end of file
+        self.assertRedirects(response, self.list_url) # Redirects to list view
+
+class TemporaryFilesMixin:
+    """
+    Temporary directories and settings overrides that are undone after each test.
+    """
+
+    def make_temp_dir(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        return temp_dir.name
+
+    def use_settings(self, **kwargs):
+        settings_override = self.settings(**kwargs)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+
+class StaticRenderTest(TemporaryFilesMixin, TestCase):
+    """
+    Tests for the static pre-rendering build (render_static) and the
+    optional serving mode that answers list/detail pages from those files.
+    """
+
+    def setUp(self):
+        self.output_root = self.make_temp_dir()
+        self.recipe1 = Recipe.objects.create(
+            title="Gazpacho",
+            ingredients="Tomato, Cucumber, Pepper",
+            steps="1. Blend. 2. Chill."
+        )
+        self.recipe2 = Recipe.objects.create(
+            title="Tortilla",
+            ingredients="Eggs, Potatoes, Onion",
+            steps="1. Fry. 2. Flip."
+        )
+
+    def build(self, **kwargs):
+        kwargs.setdefault('workers', 1)
+        return build_static_site(output_root=self.output_root, **kwargs)
+
+    def test_full_build_renders_list_and_detail_pages(self):
+        """
+        Every detail page and the list page are written with the template output.
+        """
+        result = self.build()
+        self.assertEqual(len(result['rendered']), 3)
+        detail_path = os.path.join(self.output_root, 'recipes', str(self.recipe1.pk), 'index.html')
+        with open(detail_path, encoding='utf-8') as f:
+            self.assertIn('Tomato, Cucumber, Pepper', f.read())
+        with open(os.path.join(self.output_root, 'recipes', 'index.html'), encoding='utf-8') as f:
+            content = f.read()
+        self.assertIn('Gazpacho', content)
+        self.assertIn('Tortilla', content)
+        self.assertTrue(os.path.exists(os.path.join(self.output_root, 'manifest.json')))
+
+    def test_incremental_build_only_renders_changed_pages(self):
+        """
+        A second build skips unchanged pages, re-renders edited recipes and removes deleted ones.
+        """
+        self.build()
+        self.assertEqual(self.build()['rendered'], [])
+
+        self.recipe1.steps = "1. Blend. 2. Chill overnight."
+        self.recipe1.save()
+        deleted_pk = self.recipe2.pk
+        self.recipe2.delete()
+        result = self.build()
+        self.assertEqual(
+            sorted(result['rendered']),
+            sorted(['recipes/index.html', f'recipes/{self.recipe1.pk}/index.html'])
+        )
+        self.assertEqual(result['removed'], [f'recipes/{deleted_pk}/index.html'])
+
+    def test_parallel_build_matches_in_process_build(self):
+        result = self.build(workers=2, batch_size=1)
+        self.assertEqual(len(result['rendered']), 3)
+        with open(os.path.join(self.output_root, 'recipes', 'index.html'), encoding='utf-8') as f:
+            self.assertIn('Tortilla', f.read())
+
+    def test_spawned_workers_set_up_django_themselves(self):
+        """
+        Spawned workers import the pool entry points before Django is set up.
+        """
+        pool = ProcessPoolExecutor(
+            max_workers=1, mp_context=multiprocessing.get_context('spawn'),
+            initializer=init_worker, initargs=(settings.SETTINGS_MODULE,),
+        )
+        with pool:
+            self.assertEqual(pool.submit(render_batch, self.output_root, []).result(), [])
+
+    def test_full_flag_ignores_manifest(self):
+        """
+        A full build re-renders every page but still removes deleted recipes.
+        """
+        self.build()
+        self.assertEqual(len(self.build(full=True)['rendered']), 3)
+
+        deleted_pk = self.recipe2.pk
+        self.recipe2.delete()
+        result = self.build(full=True)
+        self.assertEqual(result['removed'], [f'recipes/{deleted_pk}/index.html'])
+        self.assertFalse(os.path.exists(os.path.join(self.output_root, 'recipes', str(deleted_pk), 'index.html')))
+        self.assertEqual(self.build()['removed'], [])
+
+    def test_serving_mode_uses_prerendered_files_and_falls_back(self):
+        """
+        With STATIC_RENDER_SERVE on, rendered pages come from disk; searches and
+        pages that were never rendered fall back to the live views.
+        """
+        self.build()
+        recipe3 = Recipe.objects.create(title="Flan", ingredients="Milk, Eggs", steps="1. Bake.")
+
+        with override_settings(STATIC_RENDER_ROOT=self.output_root, STATIC_RENDER_SERVE=True):
+            response = self.client.get(reverse('recipes:recipe_detail', args=[self.recipe1.pk]))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['X-Prerendered'], '1')
+            self.assertIn(b'Gazpacho', b''.join(response.streaming_content))
+
+            response = self.client.get(reverse('recipes:recipe_detail', args=[recipe3.pk]))
+            self.assertNotIn('X-Prerendered', response)
+            self.assertContains(response, 'Flan')
+
+            response = self.client.get(reverse('recipes:recipe_list'), {'q': 'Tortilla'})
+            self.assertNotIn('X-Prerendered', response)
+            self.assertContains(response, 'Tortilla')
+
+    def test_render_static_command(self):
+        out = StringIO()
+        call_command('render_static', output=self.output_root, workers=1, stdout=out)
+        self.assertIn('Rendered 3 page(s)', out.getvalue())
+
+
+class ChunkedImageUploadTest(TemporaryFilesMixin, TestCase):
+    """
+    Tests for the resumable chunked image upload API (/api/uploads/).
+    """
+
+    def setUp(self):
+        temp_dir = self.make_temp_dir()
+        self.use_settings(
+            MEDIA_ROOT=os.path.join(temp_dir, 'media'),
+            CHUNKED_UPLOAD_TEMP_DIR=os.path.join(temp_dir, 'uploads'),
+        )
+        self.recipe = Recipe.objects.create(
+            title="Paella",
+            ingredients="Rice, Saffron, Chicken",
+            steps="1. Fry. 2. Simmer."
+        )
+        buffer = BytesIO()
+        Image.new('RGB', (640, 480), color='yellow').save(buffer, 'jpeg')
+        self.image_bytes = buffer.getvalue()
+
+    def initiate(self, size=None):
+        response = self.client.post('/api/uploads/', {
+            'recipe': self.recipe.pk,
+            'filename': 'paella.jpg',
+            'size': size or len(self.image_bytes),
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        return response.json()['id']
+
+    def put_chunk(self, upload_id, offset, data):
+        return self.client.put(
+            f'/api/uploads/{upload_id}/chunk/?offset={offset}', data,
+            content_type='application/octet-stream'
+        )
+
+    def test_chunked_upload_attaches_image(self):
+        """
+        Initiate, send the image in chunks, finalize: the recipe gets the image.
+        """
+        upload_id = self.initiate()
+        half = len(self.image_bytes) // 2
+        response = self.put_chunk(upload_id, 0, self.image_bytes[:half])
+        self.assertEqual(response.json()['offset'], half)
+        response = self.put_chunk(upload_id, half, self.image_bytes[half:])
+        self.assertEqual(response.json()['offset'], len(self.image_bytes))
+
+        response = self.client.post(f'/api/uploads/{upload_id}/finalize/')
+        self.assertEqual(response.status_code, 200)
+        self.recipe.refresh_from_db()
+        self.assertTrue(self.recipe.image.name.endswith('.jpg'))
+        with self.recipe.image.open('rb') as f:
+            self.assertEqual(f.read(), self.image_bytes)
+        self.assertFalse(self.recipe.image_uploads.exists())
+
+    def test_resume_reports_offset_and_rejects_wrong_offset(self):
+        """
+        A chunk at the wrong offset is rejected with the offset to resume from.
+        """
+        upload_id = self.initiate()
+        self.put_chunk(upload_id, 0, self.image_bytes[:100])
+        self.assertEqual(self.client.get(f'/api/uploads/{upload_id}/').json()['offset'], 100)
+
+        response = self.put_chunk(upload_id, 0, self.image_bytes[:100])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['offset'], 100)
+
+    def test_finalize_incomplete_upload_conflicts(self):
+        upload_id = self.initiate()
+        self.put_chunk(upload_id, 0, self.image_bytes[:100])
+        response = self.client.post(f'/api/uploads/{upload_id}/finalize/')
+        self.assertEqual(response.status_code, 409)
+
+    def test_finalize_rejects_non_image(self):
+        """
+        Bytes that are not an image are rejected and the upload is discarded.
+        """
+        data = b'not an image at all' * 10
+        upload_id = self.initiate(size=len(data))
+        self.put_chunk(upload_id, 0, data)
+        response = self.client.post(f'/api/uploads/{upload_id}/finalize/')
+        self.assertEqual(response.status_code, 400)
+        self.recipe.refresh_from_db()
+        self.assertFalse(self.recipe.image)
+        self.assertFalse(self.recipe.image_uploads.exists())
+
+    def test_chunk_larger_than_declared_size_is_rejected(self):
+        upload_id = self.initiate(size=10)
+        response = self.put_chunk(upload_id, 0, self.image_bytes[:20])
+        self.assertEqual(response.status_code, 400)
+
+    def test_concurrent_requests_for_one_upload_conflict(self):
+        """
+        While one request holds the upload (writing a chunk or finalizing),
+        others are turned away instead of writing into the same file.
+        """
+        upload_id = self.initiate()
+        upload = RecipeImageUpload.objects.get(pk=upload_id)
+        with upload_lock(upload.temp_path):
+            response = self.put_chunk(upload_id, 0, self.image_bytes[:100])
+            self.assertEqual(response.status_code, 409)
+            self.assertEqual(response.json()['offset'], 0)
+        self.assertEqual(self.put_chunk(upload_id, 0, self.image_bytes).status_code, 200)
+        with upload_lock(upload.temp_path):
+            self.assertEqual(self.client.post(f'/api/uploads/{upload_id}/finalize/').status_code, 409)
+        self.assertEqual(self.client.post(f'/api/uploads/{upload_id}/finalize/').status_code, 200)
+
+    def test_finalize_without_part_file_is_not_found(self):
+        upload_id = self.initiate()
+        self.put_chunk(upload_id, 0, self.image_bytes)
+        os.remove(RecipeImageUpload.objects.get(pk=upload_id).temp_path)
+        response = self.client.post(f'/api/uploads/{upload_id}/finalize/')
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(self.recipe.image_uploads.exists())
+
+    def test_purge_uploads_removes_expired_uploads(self):
+        stale_id, fresh_id = self.initiate(), self.initiate()
+        self.put_chunk(stale_id, 0, self.image_bytes[:100])
+        self.put_chunk(fresh_id, 0, self.image_bytes[:100])
+        RecipeImageUpload.objects.filter(pk=stale_id).update(updated_at=timezone.now() - timezone.timedelta(days=2))
+        orphan = get_upload_temp_dir() / 'orphan.part'
+        orphan.write_bytes(b'left over')
+        os.utime(orphan, (0, 0))
+
+        out = StringIO()
+        call_command('purge_uploads', stdout=out)
+        self.assertIn('Removed 1 expired upload(s) and 1 orphaned file(s)', out.getvalue())
+        self.assertEqual(str(self.recipe.image_uploads.get().pk), fresh_id)
+        self.assertFalse(orphan.exists())
+        self.assertFalse((get_upload_temp_dir() / f'{stale_id}.part').exists())
+        self.assertTrue((get_upload_temp_dir() / f'{fresh_id}.part').exists())
+
+    def test_oversized_upload_is_rejected_at_initiate(self):
+        with override_settings(CHUNKED_UPLOAD_MAX_SIZE=100):
+            response = self.client.post('/api/uploads/', {
+                'recipe': self.recipe.pk, 'filename': 'big.jpg', 'size': 101,
+            }, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+class ContentAddressedStorageTest(TemporaryFilesMixin, TestCase):
+    """
+    Tests for the content-addressed Recipe.image storage and its maintenance commands.
+    """
+
+    def setUp(self):
+        self.temp_dir = self.make_temp_dir()
+        self.use_settings(MEDIA_ROOT=self.temp_dir)
+        buffer = BytesIO()
+        Image.new('RGB', (50, 50), color='green').save(buffer, 'jpeg')
+        self.image_bytes = buffer.getvalue()
+
+    def image_files(self):
+        files = []
+        for dirpath, dirnames, filenames in os.walk(self.temp_dir):
+            files.extend(filenames)
+        return sorted(files)
+
+    def create_recipe(self, title, image_name='photo.jpg'):
+        return Recipe.objects.create(
+            title=title,
+            ingredients="Something",
+            steps="1. Do it.",
+            image=SimpleUploadedFile(image_name, self.image_bytes, content_type='image/jpeg')
+        )
+
+    def test_identical_uploads_share_one_file(self):
+        """
+        The same content uploaded twice is stored once under its digest.
+        """
+        first = self.create_recipe("First", 'photo.jpg')
+        second = self.create_recipe("Second", 'photo_copy.JPG')
+        digest = hashlib.sha256(self.image_bytes).hexdigest()
+        self.assertEqual(first.image.name, f'recipe_images/{digest}.jpg')
+        self.assertEqual(second.image.name, first.image.name)
+        self.assertEqual(self.image_files(), [f'{digest}.jpg'])
+
+    def test_delete_keeps_shared_file(self):
+        first = self.create_recipe("First")
+        second = self.create_recipe("Second")
+        first.image.delete()
+        self.assertTrue(second.image.storage.exists(second.image.name))
+
+    def test_dedupe_and_gc_commands(self):
+        """
+        Legacy copies are re-stored under one digest name, then gc removes the old files.
+        """
+        os.makedirs(os.path.join(self.temp_dir, 'recipe_images'))
+        for index, legacy_name in enumerate(['test_image.jpg', 'test_image_7hHT1WE.jpg']):
+            with open(os.path.join(self.temp_dir, 'recipe_images', legacy_name), 'wb') as f:
+                f.write(self.image_bytes)
+            Recipe.objects.create(
+                title=f"Legacy {index}", ingredients="x", steps="y",
+                image=f'recipe_images/{legacy_name}'
+            )
+
+        call_command('dedupe_recipe_images', stdout=StringIO())
+        names = set(Recipe.objects.values_list('image', flat=True))
+        self.assertEqual(len(names), 1)
+        self.assertEqual(len(self.image_files()), 3)
+
+        call_command('gc_recipe_images', min_age=0, stdout=StringIO())
+        self.assertEqual(self.image_files(), [os.path.basename(names.pop())])
+
+    def test_reused_blob_is_protected_from_gc(self):
+        """
+        An upload that dedupes onto an old orphaned blob refreshes its mtime,
+        so a garbage collection running at the same time keeps it.
+        """
+        recipe = self.create_recipe("First")
+        blob_path = recipe.image.path
+        recipe.delete()
+        os.utime(blob_path, (0, 0))  # An orphan, old enough to be collected
+
+        # The upload has been stored, but the recipe referencing it is not saved yet
+        storage = Recipe._meta.get_field('image').storage
+        name = storage.save('recipe_images/photo.jpg', ContentFile(self.image_bytes))
+        self.assertEqual(storage.path(name), blob_path)
+        call_command('gc_recipe_images', stdout=StringIO())
+        self.assertTrue(os.path.exists(blob_path))
+
+    def test_gc_respects_min_age(self):
+        os.makedirs(os.path.join(self.temp_dir, 'recipe_images'))
+        with open(os.path.join(self.temp_dir, 'recipe_images', 'orphan.jpg'), 'wb') as f:
+            f.write(self.image_bytes)
+        call_command('gc_recipe_images', stdout=StringIO())
+        self.assertEqual(self.image_files(), ['orphan.jpg'])
+
+
+class FileServingTest(TemporaryFilesMixin, TestCase):
+    """
+    Tests for the production static/media serving views (recipes.serving):
+    Range requests, ETags, sendfile offload and precompressed static files.
+    """
+
+    def setUp(self):
+        temp_dir = self.make_temp_dir()
+        self.media_root = os.path.join(temp_dir, 'media')
+        self.static_root = os.path.join(temp_dir, 'static')
+        self.source_dir = os.path.join(temp_dir, 'source')
+        for directory in (self.media_root, self.static_root, self.source_dir):
+            os.makedirs(directory)
+        self.use_settings(
+            MEDIA_ROOT=self.media_root,
+            STATIC_ROOT=self.static_root,
+            STATICFILES_DIRS=[self.source_dir],
+        )
+
+        self.content = bytes(range(256)) * 4
+        with open(os.path.join(self.media_root, 'clip.bin'), 'wb') as f:
+            f.write(self.content)
+
+    def body(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_full_media_response_has_validators(self):
+        response = self.client.get('/media/clip.bin')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), self.content)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('ETag', response)
+        self.assertIn('max-age=', response['Cache-Control'])
+
+    def test_range_requests(self):
+        response = self.client.get('/media/clip.bin', HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(self.content)}')
+        self.assertEqual(self.body(response), self.content[10:20])
+
+        response = self.client.get('/media/clip.bin', HTTP_RANGE='bytes=-5')
+        self.assertEqual(self.body(response), self.content[-5:])
+
+        response = self.client.get('/media/clip.bin', HTTP_RANGE=f'bytes={len(self.content)}-')
+        self.assertEqual(response.status_code, 416)
+
+    def test_if_range_mismatch_sends_full_file(self):
+        response = self.client.get('/media/clip.bin', HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_etag_revalidation(self):
+        etag = self.client.get('/media/clip.bin')['ETag']
+        response = self.client.get('/media/clip.bin', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_missing_and_traversal_paths_404(self):
+        self.assertEqual(self.client.get('/media/nope.bin').status_code, 404)
+        self.assertEqual(self.client.get('/media/../settings.py').status_code, 404)
+
+    def test_accel_redirect_offload(self):
+        with override_settings(MEDIA_SENDFILE_BACKEND='x-accel-redirect'):
+            response = self.client.get('/media/clip.bin')
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/clip.bin')
+        self.assertEqual(response.content, b'')
+
+    def test_content_addressed_media_is_served_immutable(self):
+        name = hashlib.sha256(self.content).hexdigest() + '.bin'
+        with open(os.path.join(self.media_root, name), 'wb') as f:
+            f.write(self.content)
+        response = self.client.get('/media/' + name)
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(response['ETag'], f'"{name[:-4]}"')
+
+    def test_missing_manifest_only_falls_back_when_enabled(self):
+        strict = CompressedManifestStaticFilesStorage(location=self.static_root)
+        with self.assertRaises(ValueError):
+            strict.stored_name('site.css')
+        lenient = CompressedManifestStaticFilesStorage(location=self.static_root, manifest_fallback=True)
+        self.assertEqual(lenient.stored_name('site.css'), 'site.css')
+
+    def test_collectstatic_hashes_and_precompresses(self):
+        """
+        collectstatic writes hashed names and .gz variants; the hashed file is
+        served immutable and gzip-encoded to clients that accept it.
+        """
+        css = b'body { color: #333; }\n' * 50
+        with open(os.path.join(self.source_dir, 'site.css'), 'wb') as f:
+            f.write(css)
+        call_command('collectstatic', interactive=False, stdout=StringIO())
+        hashed_name = staticfiles_storage.stored_name('site.css')
+        self.assertNotEqual(hashed_name, 'site.css')
+        self.assertTrue(os.path.exists(os.path.join(self.static_root, hashed_name + '.gz')))
+
+        response = self.client.get('/static/' + hashed_name, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(gzip.decompress(self.body(response)), css)
+
+        response = self.client.get('/static/' + hashed_name)
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(self.body(response), css)
+
+
+class WriteCoalescerTest(TransactionTestCase):
+    """
+    Tests for the group-commit write path (recipes.write_coalescer).
+    Uses TransactionTestCase because the writer thread commits on its own connection.
+    """
+
+    def test_concurrent_writes_get_their_own_results(self):
+        """
+        Writes submitted from several threads are committed, and each caller
+        gets its own result or its own unique-title error.
+        """
+        coalescer = WriteCoalescer(window=0.05)
+        Recipe.objects.create(title="Taken", ingredients="x", steps="y")
+        results = {}
+
+        def write(title):
+            try:
+                results[title] = coalescer.submit(
+                    Recipe.objects.create, title=title, ingredients="x", steps="y"
+                )
+            except IntegrityError as exc:
+                results[title] = exc
+            finally:
+                connection.close()
+
+        titles = ["Soup", "Stew", "Taken", "Salad"]
+        threads = [threading.Thread(target=write, args=(title,)) for title in titles]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertIsInstance(results["Taken"], IntegrityError)
+        for title in ("Soup", "Stew", "Salad"):
+            self.assertEqual(results[title].title, title)
+            self.assertIsNotNone(results[title].pk)
+        self.assertEqual(Recipe.objects.count(), 4)
+
+    def test_writer_survives_errors_and_callers_do_not_wait_forever(self):
+        coalescer = WriteCoalescer(window=0, timeout=0.2)
+        with mock.patch('recipes.write_coalescer.close_old_connections', side_effect=RuntimeError('boom')), \
+                self.assertLogs('recipes.write_coalescer', 'ERROR'):
+            with self.assertRaisesMessage(RuntimeError, 'boom'):
+                coalescer.submit(Recipe.objects.create, title="Lost", ingredients="x", steps="y")
+        # The writer thread is still alive and keeps committing
+        recipe = coalescer.submit(Recipe.objects.create, title="Kept", ingredients="x", steps="y")
+        self.assertEqual(Recipe.objects.get().pk, recipe.pk)
+
+        with self.assertRaises(DatabaseError):
+            coalescer.submit(time.sleep, 0.5)
+        self.assertTrue(coalescer._thread.is_alive())
+
+    def test_views_write_through_coalescer(self):
+        with override_settings(WRITE_COALESCING=True):
+            response = self.client.post(reverse('recipes:recipe_create'), {
+                'title': 'Coalesced Cake',
+                'ingredients': 'Flour',
+                'steps': 'Bake',
+            })
+            self.assertEqual(response.status_code, 302)
+            recipe = Recipe.objects.get(title='Coalesced Cake')
+
+            response = self.client.post('/api/recipes/', {
+                'title': 'Coalesced Pie', 'ingredients': 'Apples', 'steps': 'Bake',
+            })
+            self.assertEqual(response.status_code, 201)
+
+            response = self.client.post(reverse('recipes:recipe_delete', args=[recipe.pk]))
+            self.assertEqual(response.status_code, 302)
+        self.assertEqual(list(Recipe.objects.values_list('title', flat=True)), ['Coalesced Pie'])
+
+    def test_duplicate_title_race_becomes_form_error(self):
+        """
+        An IntegrityError at commit time is reported as a title error, not a 500.
+        """
+        with mock.patch('recipes.views.run_write', side_effect=IntegrityError('UNIQUE constraint failed')):
+            response = self.client.post(reverse('recipes:recipe_create'), {
+                'title': 'Racy', 'ingredients': 'x', 'steps': 'y',
+            })
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Recipe with this Title already exists.')
+
+
+class RequestProfilerTest(TemporaryFilesMixin, TestCase):
+    """
+    Tests for the on-demand request profiler middleware and its staff-only viewer.
+    """
+
+    def setUp(self):
+        self.temp_dir = self.make_temp_dir()
+        self.use_settings(PROFILER_ENABLED=True, PROFILER_STORAGE_DIR=self.temp_dir)
+        Recipe.objects.create(title="Paella", ingredients="Rice", steps="Cook")
+
+    def profiled_get(self, url, **extra):
+        return self.client.get(url, HTTP_X_PROFILE_TOKEN=make_profile_token(), **extra)
+
+    def test_signed_token_profiles_request(self):
+        """
+        A valid token stores a profile with function timings and the SQL that ran.
+        """
+        response = self.profiled_get(reverse('recipes:recipe_list'), data={'q': 'Rice'})
+        self.assertEqual(response.status_code, 200)
+        profile = load_profile(response['X-Profile-Id'])
+        self.assertEqual(profile['path'], '/recipes/?q=Rice')
+        self.assertEqual(profile['trigger'], 'token')
+        self.assertTrue(profile['functions'])
+        self.assertTrue(any('recipes_recipe' in statement['sql'] for statement in profile['sql']))
+
+    def test_query_string_token_is_not_stored(self):
+        response = self.client.get(reverse('recipes:recipe_list'), {'q': 'Rice', '_profile': make_profile_token()})
+        self.assertEqual(load_profile(response['X-Profile-Id'])['path'], '/recipes/?q=Rice')
+        response = self.client.get(reverse('recipes:recipe_list'), {'_profile': make_profile_token()})
+        self.assertEqual(load_profile(response['X-Profile-Id'])['path'], '/recipes/')
+
+    def test_requests_without_valid_token_are_not_profiled(self):
+        self.assertNotIn('X-Profile-Id', self.client.get(reverse('recipes:recipe_list')))
+        response = self.client.get(reverse('recipes:recipe_list'), HTTP_X_PROFILE_TOKEN='profile:forged')
+        self.assertNotIn('X-Profile-Id', response)
+
+    def test_sampling_rate_and_sampling_mode(self):
+        """
+        PROFILER_SAMPLE_RATE picks requests without a token; sampling mode records stacks.
+        """
+        with override_settings(PROFILER_SAMPLE_RATE=1.0, PROFILER_MODE='sampling', PROFILER_SAMPLING_INTERVAL=0.0005):
+            response = self.client.get('/api/recipes/')
+        profile = load_profile(response['X-Profile-Id'])
+        self.assertEqual(profile['trigger'], 'sample')
+        self.assertEqual(profile['mode'], 'sampling')
+        tree = flame_graph_tree(profile['stacks'])
+        self.assertEqual(tree['value'], sum(profile['stacks'].values()))
+
+    def test_retention_limit(self):
+        with override_settings(PROFILER_MAX_PROFILES=2):
+            ids = [self.profiled_get('/api/recipes/')['X-Profile-Id'] for _ in range(3)]
+        self.assertEqual(sorted(os.listdir(self.temp_dir)), [f'{ids[1]}.json', f'{ids[2]}.json'])
+
+    def test_viewer_is_staff_only(self):
+        profile_id = self.profiled_get(reverse('recipes:recipe_list'))['X-Profile-Id']
+        detail_url = reverse('profiling:profile_detail', args=[profile_id])
+
+        response = self.client.get(reverse('profiling:profile_list'))
+        self.assertEqual(response.status_code, 302)
+
+        staff = User.objects.create_user('staff', password='secret', is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get(reverse('profiling:profile_list'))
+        self.assertContains(response, profile_id)
+        response = self.client.get(detail_url)
+        self.assertContains(response, 'recipes_recipe')
+        self.assertEqual(self.client.get(reverse('profiling:profile_detail', args=['..etc'])).status_code, 404)
+
+
+class AdmissionControlTest(TemporaryFilesMixin, TestCase):
+    """
+    Tests for the admission control middleware (per-class concurrency, token
+    buckets, bounded queues, priority shares) and its shared file-backed state.
+    """
+
+    def setUp(self):
+        temp_dir = self.make_temp_dir()
+        self.classes = [
+            {'name': 'detail', 'pattern': r'^/recipes/\d+/', 'priority': 0,
+             'max_concurrency': 2, 'global_share': 1.0, 'max_queue': 4, 'max_wait': 0.05},
+            {'name': 'search', 'pattern': r'^/recipes/\?(.*&)?q=', 'priority': 1,
+             'max_concurrency': 2, 'global_share': 0.5, 'rate': 1, 'burst': 1, 'max_queue': 0},
+        ]
+        self.use_settings(
+            ADMISSION_CONTROL_ENABLED=True,
+            ADMISSION_CONTROL_STATE_FILE=os.path.join(temp_dir, 'admission.state'),
+            ADMISSION_CONTROL_CLASSES=self.classes,
+            ADMISSION_CONTROL_GLOBAL_CONCURRENCY=2,
+        )
+        self.recipe = Recipe.objects.create(title="Paella", ingredients="Rice", steps="Cook")
+        self.detail_url = reverse('recipes:recipe_detail', args=[self.recipe.pk])
+
+    def controller(self):
+        return get_admission_controller()
+
+    def test_admitted_requests_are_counted(self):
+        self.assertEqual(self.client.get(self.detail_url).status_code, 200)
+        self.assertEqual(self.client.get(reverse('recipes:recipe_list')).status_code, 200)  # Unclassified
+        stats = self.controller().stats()
+        self.assertEqual(stats['detail']['admitted'], 1)
+        self.assertEqual(stats['detail']['in_flight'], 0)
+
+    def test_rate_limit_returns_429(self):
+        list_url = reverse('recipes:recipe_list')
+        self.assertEqual(self.client.get(list_url, {'q': 'rice'}).status_code, 200)
+        response = self.client.get(list_url, {'q': 'rice'})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(self.controller().stats()['search']['shed_rate'], 1)
+
+    def test_full_class_waits_then_sheds_with_503(self):
+        controller = self.controller()
+        detail = controller.classes[0]
+        slots = [controller.acquire(detail), controller.acquire(detail)]
+        response = self.client.get(self.detail_url)
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+        stats = controller.stats()
+        self.assertEqual(stats['detail']['shed_timeout'], 1)
+        self.assertEqual(stats['detail']['queued'], 0)
+
+        for slot in slots:
+            controller.release(detail, slot)
+        self.assertEqual(self.client.get(self.detail_url).status_code, 200)
+
+    def test_low_priority_class_cannot_take_protected_share(self):
+        """
+        With a global limit of 2, search may use only half; detail still gets in.
+        """
+        controller = self.controller()
+        search = controller.classes[1]
+        self.assertIsNotNone(controller.acquire(search))
+        self.assertIsNone(controller.acquire(search))  # Over its global share, queue size 0
+        self.assertEqual(self.client.get(self.detail_url).status_code, 200)
+        self.assertEqual(controller.stats()['search']['shed_queue_full'], 1)
+
+    def test_state_is_shared_across_processes(self):
+        """
+        A slot taken in a forked worker is visible here, and is reclaimed once that worker is gone.
+        """
+        controller = self.controller()
+        detail = controller.classes[0]
+
+        def hold_slot():
+            controller.acquire(detail)
+            os._exit(0)  # Exit without releasing, like a crashed worker
+
+        process = multiprocessing.get_context('fork').Process(target=hold_slot)
+        process.start()
+        process.join()
+        self.assertEqual(controller.stats()['detail']['in_flight'], 1)
+
+        # A full class triggers reclaiming of slots owned by dead processes
+        first = controller.acquire(detail)
+        second = controller.acquire(detail)
+        self.assertIsNotNone(first)
+        self.assertIsNotNone(second)
+
+    def test_queue_places_of_dead_waiters_are_reclaimed(self):
+        """
+        A worker killed while queued does not keep its queue place forever.
+        """
+        controller = self.controller()
+        detail = controller.classes[0]
+        slots = [controller.acquire(detail), controller.acquire(detail)]
+
+        def wait_then_die():
+            time.sleep = lambda seconds: os._exit(0)  # Killed while waiting in the queue
+            controller.acquire(detail)
+
+        processes = [multiprocessing.get_context('fork').Process(target=wait_then_die) for _ in range(4)]
+        for process in processes:
+            process.start()
+            process.join()
+        # Each waiter reclaimed the places of those that died before it; the last one is still listed
+        self.assertEqual(controller.stats()['detail']['queued'], 1)
+
+        # The dead waiters' places are reclaimed: the next request queues (and times out) instead of
+        # finding the queue full
+        self.assertEqual(self.client.get(self.detail_url).status_code, 503)
+        stats = controller.stats()['detail']
+        self.assertEqual((stats['queued'], stats['shed_queue_full'], stats['shed_timeout']), (0, 0, 1))
+        for slot in slots:
+            controller.release(detail, slot)
+
+    def test_reclaimed_slot_is_not_freed_by_its_previous_holder(self):
+        controller = self.controller()
+        detail = controller.classes[0]
+        stale = controller.acquire(detail)
+        controller.acquire(detail)
+        with mock.patch.object(controller, 'lease_timeout', 0):
+            # The class is full, so the expired leases are reclaimed and one is taken again
+            current = controller.acquire(detail)
+        self.assertEqual(current[0], stale[0])
+        controller.release(detail, stale)  # The stale holder finally finishes
+        self.assertEqual(controller.stats()['detail']['in_flight'], 1)
+        controller.release(detail, current)
+        self.assertEqual(controller.stats()['detail']['in_flight'], 0)
+
+    def test_stats_endpoint(self):
+        response = self.client.get('/admin/admission/stats/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('detail', response.json()['classes'])
+        response = self.client.get('/admin/admission/stats/', REMOTE_ADDR='10.0.0.5')
+        self.assertEqual(response.status_code, 403)
+
+SHARD_ALIASES = ['shard_a', 'shard_b', 'shard_c']
+
+class ShardingTest(TemporaryFilesMixin, TransactionTestCase):
+    """
+    Tests for horizontal sharding (recipes.sharding): id allocation, routing,
+    fan-out queries merged in title order, the admin, and rebalancing.
+    Uses TransactionTestCase with file-backed shard databases, so the fan-out
+    threads really run in parallel on their own connections. The shard aliases
+    are registered for this class only (they are not in settings.DATABASES).
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.shard_dir = tempfile.TemporaryDirectory()
+        for alias in SHARD_ALIASES:
+            connections.settings[alias] = {
+                **connections.settings['default'],
+                'NAME': os.path.join(cls.shard_dir.name, f'{alias}.sqlite3'),
+            }
+        cls.databases = {'default', *SHARD_ALIASES}
+        # All three aliases are shards as far as migrate and flush are concerned;
+        # tests run on the first two unless they override RECIPE_SHARDS themselves
+        cls.shards_override = override_settings(RECIPE_SHARDS=SHARD_ALIASES)
+        cls.shards_override.enable()
+        super().setUpClass()
+        migrate_shards()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.shards_override.disable()
+        for alias in SHARD_ALIASES:
+            connections[alias].close()
+            del connections[alias]
+            del connections.settings[alias]
+        cls.databases = {'default'}
+        cls.shard_dir.cleanup()
+
+    def setUp(self):
+        reset_id_allocators()  # The id sequence table is flushed between tests
+        self.use_settings(RECIPE_SHARDS=SHARD_ALIASES[:2])
+
+    def create_recipes(self, count):
+        return [
+            Recipe.objects.create(title=f"Recipe {index:02d}", ingredients="Flour", steps="Bake")
+            for index in range(count)
+        ]
+
+    def test_jump_hash_only_moves_keys_to_new_shard(self):
+        for key in range(0, 2 ** 64, 2 ** 58):
+            before, after = jump_hash(key, 3), jump_hash(key, 4)
+            self.assertTrue(after == before or after == 3)
+
+    def test_recipes_spread_across_shards_with_unique_ids(self):
+        recipes = self.create_recipes(20)
+        ids = [recipe.pk for recipe in recipes]
+        self.assertEqual(len(set(ids)), 20)
+        for recipe in recipes:
+            self.assertEqual(recipe._state.db, shard_for_key(recipe.pk))
+            self.assertTrue(Recipe.objects.using(recipe._state.db).filter(pk=recipe.pk).exists())
+        counts = [Recipe.objects.using(alias).count() for alias in SHARD_ALIASES[:2]]
+        self.assertEqual(sum(counts), 20)
+        self.assertTrue(all(counts))
+        self.assertEqual(Recipe.objects.using('default').count(), 0)
+
+    def test_id_blocks_survive_a_rolled_back_transaction(self):
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic('default'):
+                first = allocate_id(RECIPE_ID_SEQUENCE)
+                raise RuntimeError
+        reset_id_allocators()  # Stands in for another process
+        self.assertNotEqual(allocate_id(RECIPE_ID_SEQUENCE), first)
+
+    def test_writes_bypass_the_coalescer(self):
+        with override_settings(WRITE_COALESCING=True), \
+                mock.patch('recipes.write_coalescer.get_write_coalescer') as get_write_coalescer:
+            response = self.client.post(reverse('recipes:recipe_create'), {
+                'title': "Sharded Soup", 'ingredients': "Water", 'steps': "Boil",
+            })
+        self.assertEqual(response.status_code, 302)
+        get_write_coalescer.assert_not_called()
+        self.assertTrue(Recipe.objects.filter(title="Sharded Soup").exists())
+
+    def test_fan_out_queries_are_merged_in_title_order(self):
+        recipes = self.create_recipes(15)
+        titles = sorted(recipe.title for recipe in recipes)
+
+        self.assertEqual([recipe.title for recipe in Recipe.objects.all()], titles)
+        self.assertEqual(list(Recipe.objects.values_list('title', flat=True)), titles)
+        self.assertEqual([recipe.title for recipe in Recipe.objects.all()[5:10]], titles[5:10])
+        self.assertEqual(
+            [recipe.title for recipe in Recipe.objects.order_by('-title').iterator()], titles[::-1]
+        )
+        self.assertEqual(Recipe.objects.count(), 15)
+        self.assertEqual(Recipe.objects.filter(title__endswith='3').count(), 2)
+        self.assertTrue(Recipe.objects.filter(title="Recipe 14").exists())
+        self.assertEqual(Recipe.objects.aggregate(Max('title'))['title__max'], titles[-1])
+        self.assertEqual(Recipe.objects.get(pk=recipes[3].pk).title, recipes[3].title)
+
+        # List view: second page of 9
+        response = self.client.get(reverse('recipes:recipe_list'), {'page': 2})
+        self.assertEqual([recipe.title for recipe in response.context['recipes']], titles[9:])
+        response = self.client.get(reverse('recipes:recipe_list'), {'q': 'Recipe 1'})
+        self.assertEqual(len(response.context['recipes']), 5)  # Recipe 10..14
+        response = self.client.get('/api/recipes/')
+        self.assertEqual([item['title'] for item in response.json()], titles)
+
+    def test_values_queries_are_merged_on_unselected_ordering_fields(self):
+        recipes = self.create_recipes(6)
+        self.assertGreater(len({recipe._state.db for recipe in recipes}), 1)
+        titles = ["F", "B", "E", "A", "C", "D"]  # Title order differs from id and shard order
+        for recipe, title in zip(recipes, titles):
+            Recipe.objects.filter(pk=recipe.pk).update(title=title)
+        by_title = [recipe.pk for title, recipe in sorted(zip(titles, recipes), key=lambda pair: pair[0])]
+
+        self.assertEqual(list(Recipe.objects.values_list('pk')[:3]), [(pk,) for pk in by_title[:3]])
+        self.assertEqual(list(Recipe.objects.values_list('pk', flat=True)), by_title)
+        self.assertEqual(list(Recipe.objects.values('pk')[1:4]), [{'pk': pk} for pk in by_title[1:4]])
+        self.assertEqual([row.pk for row in Recipe.objects.values_list('pk', named=True)], by_title)
+        self.assertEqual(list(Recipe.objects.order_by('-title').values_list('pk', flat=True).iterator()), by_title[::-1])
+        self.assertEqual(
+            [pk for pk, updated_at in Recipe.objects.order_by('title').values_list('pk', 'updated_at')], by_title
+        )
+
+    def test_single_object_views_query_only_the_owning_shard(self):
+        recipe = self.create_recipes(1)[0]
+        owner = recipe._state.db
+        other = next(alias for alias in SHARD_ALIASES[:2] if alias != owner)
+
+        with CaptureQueriesContext(connections[other]) as other_queries:
+            self.assertEqual(self.client.get(reverse('recipes:recipe_detail', args=[recipe.pk])).status_code, 200)
+            self.assertEqual(self.client.get(f'/api/recipes/{recipe.pk}/').status_code, 200)
+            response = self.client.patch(
+                f'/api/recipes/{recipe.pk}/', {'steps': 'Bake longer'}, content_type='application/json'
+            )
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(other_queries), 0)
+
+        response = self.client.post(reverse('recipes:recipe_update', args=[recipe.pk]), {
+            'title': 'Renamed', 'ingredients': 'Flour', 'steps': 'Bake',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Recipe.objects.using(owner).get(pk=recipe.pk).title, 'Renamed')
+
+        response = self.client.post(reverse('recipes:recipe_delete', args=[recipe.pk]))
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Recipe.objects.exists())
+        self.assertEqual(self.client.get(f'/api/recipes/{recipe.pk}/').status_code, 404)
+
+    def test_titles_are_unique_across_shards(self):
+        recipes = self.create_recipes(6)
+        self.assertGreater(len({recipe._state.db for recipe in recipes}), 1)
+        for recipe in recipes:
+            response = self.client.post('/api/recipes/', {
+                'title': recipe.title, 'ingredients': 'x', 'steps': 'y',
+            })
+            self.assertEqual(response.status_code, 400)
+        response = self.client.post('/api/recipes/', {'title': 'New one', 'ingredients': 'x', 'steps': 'y'})
+        self.assertEqual(response.status_code, 201)
+        created = Recipe.objects.get(title='New one')
+        self.assertEqual(created._state.db, shard_for_key(created.pk))
+
+    def test_admin_lists_searches_and_deletes_across_shards(self):
+        recipes = self.create_recipes(6)
+        User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.login(username='admin', password='password')
+
+        response = self.client.get('/admin/recipes/recipe/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['cl'].result_count, 6)
+        response = self.client.get('/admin/recipes/recipe/', {'q': 'Recipe 03'})
+        self.assertEqual(response.context['cl'].result_count, 1)
+
+        target = recipes[2]
+        delete_url = f'/admin/recipes/recipe/{target.pk}/delete/'
+        self.assertEqual(self.client.get(delete_url).status_code, 200)
+        self.assertEqual(self.client.post(delete_url, {'post': 'yes'}).status_code, 302)
+        self.assertFalse(Recipe.objects.filter(pk=target.pk).exists())
+        self.assertEqual(Recipe.objects.count(), 5)
+
+    def test_rebalance_moves_recipes_to_their_owners(self):
+        with override_settings(RECIPE_SHARDS=[]):
+            legacy = Recipe.objects.using('default').create(title="Legacy", ingredients="x", steps="y")
+        with override_settings(RECIPE_SHARDS=SHARD_ALIASES[:1]):
+            recipes = self.create_recipes(12)
+        created_at = {recipe.pk: recipe.created_at for recipe in recipes}
+
+        with override_settings(RECIPE_SHARDS=SHARD_ALIASES):
+            call_command('rebalance_recipe_shards', '--from', 'default', '--batch-size', '5', stdout=StringIO())
+            self.assertEqual(Recipe.objects.using('default').count(), 0)
+            self.assertEqual(Recipe.objects.count(), 13)
+            for recipe in Recipe.objects.all():
+                self.assertEqual(recipe._state.db, shard_for_key(recipe.pk))
+                if recipe.pk in created_at:
+                    self.assertEqual(recipe.created_at, created_at[recipe.pk])
+            self.assertTrue(all(Recipe.objects.using(alias).exists() for alias in SHARD_ALIASES))
+
+            # Running it again finds nothing to move
+            out = StringIO()
+            call_command('rebalance_recipe_shards', stdout=out)
+            self.assertIn('Moved 0 recipe(s)', out.getvalue())
+
+            # Ids never collided with the legacy recipe, and new ones continue after all of them
+            highest = max(Recipe.objects.values_list('pk', flat=True))
+            self.assertEqual(Recipe.objects.get(pk=legacy.pk).title, "Legacy")
+            self.assertGreater(Recipe.objects.create(title="Fresh", ingredients="x", steps="y").pk, highest)
+
+class RecipeBatchApiTest(TestCase):
+    """
+    Tests for GET/POST /api/recipes/batch/ and the per-object representation
+    cache shared with GET /api/recipes/{id}/.
+    """
+
+    def setUp(self):
+        get_cache().clear()
+        self.recipes = [
+            Recipe.objects.create(title=title, ingredients="Rice", steps="Cook")
+            for title in ("Paella", "Risotto", "Biryani")
+        ]
+        self.url = '/api/recipes/batch/'
+
+    def test_batch_keeps_order_and_reports_missing(self):
+        paella, risotto, biryani = self.recipes
+        missing_id = biryani.pk + 100
+        response = self.client.get(self.url, {'ids': f'{biryani.pk},{missing_id},{paella.pk},{biryani.pk}'})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual([item['title'] for item in data['results']], ["Biryani", "Paella"])
+        self.assertEqual(data['missing'], [missing_id])
+
+    def test_batch_post_accepts_long_lists(self):
+        ids = [recipe.pk for recipe in reversed(self.recipes)]
+        response = self.client.post(self.url, {'ids': ids}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['id'] for item in response.json()['results']], ids)
+
+        response = self.client.post(self.url, {'ids': f'{ids[0]},{ids[1]}'})  # Form-encoded
+        self.assertEqual([item['id'] for item in response.json()['results']], ids[:2])
+
+    def test_batch_rejects_invalid_requests(self):
+        self.assertEqual(self.client.get(self.url).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'ids': '1,abc'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'ids': '1,99999999999999999999'}).status_code, 400)
+        response = self.client.post(self.url, {'ids': [2 ** 63]}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(self.url, {'ids': [1, True]}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        with override_settings(RECIPE_BATCH_MAX_IDS=2):
+            self.assertEqual(self.client.get(self.url, {'ids': '1,2,3'}).status_code, 400)
+
+    def test_batch_serves_hits_from_cache_and_loads_only_misses(self):
+        ids = ','.join(str(recipe.pk) for recipe in self.recipes)
+        with self.assertNumQueries(2):  # Versions, then one in_bulk for the misses
+            first = self.client.get(self.url, {'ids': ids}).json()
+        with self.assertNumQueries(1):  # Versions only
+            second = self.client.get(self.url, {'ids': ids}).json()
+        self.assertEqual(first, second)
+
+        # A saved recipe gets a new (pk, updated_at) key, so it is never served stale
+        risotto = self.recipes[1]
+        risotto.steps = "Stir for 20 minutes"
+        risotto.save()
+        with self.assertNumQueries(2):
+            third = self.client.get(self.url, {'ids': ids}).json()
+        self.assertEqual(third['results'][1]['steps'], "Stir for 20 minutes")
+
+    def test_retrieve_uses_representation_cache(self):
+        recipe = self.recipes[0]
+        with mock.patch.object(
+            RecipeSerializer, 'to_representation', autospec=True, side_effect=RecipeSerializer.to_representation
+        ) as to_representation:
+            first = self.client.get(f'/api/recipes/{recipe.pk}/').json()
+            second = self.client.get(f'/api/recipes/{recipe.pk}/').json()
+            self.client.get(self.url, {'ids': str(recipe.pk)})  # Shares the same entries
+        self.assertEqual(first, second)
+        self.assertEqual(to_representation.call_count, 1)
+        self.assertEqual(self.client.get('/api/recipes/999999/').status_code, 404)
+
+
+class FastBootTest(TestCase):
+    """
+    Tests for the lazily loaded URLconfs, warm_up() and the startup_profile command.
+    """
+
+    def make_urlconf(self, *patterns):
+        class URLConf:
+            urlpatterns = [path('recipes/', include('recipes.urls')), *patterns]
+        return URLConf
+
+    def test_lazy_urlconf_loads_on_first_use(self):
+        lazy = lazy_path('admin/profiles/', 'recipes.profiling_urls', 'profiling')
+        urlconf = self.make_urlconf(lazy)
+
+        # Reversing or resolving outside the lazy prefix does not load it
+        self.assertEqual(reverse('recipes:recipe_list', urlconf=urlconf), '/recipes/')
+        self.assertEqual(resolve('/recipes/', urlconf=urlconf).url_name, 'recipe_list')
+        self.assertFalse(lazy.urlconf_module.loaded)
+
+        self.assertEqual(reverse('profiling:profile_list', urlconf=urlconf), '/admin/profiles/')
+        self.assertTrue(lazy.urlconf_module.loaded)
+
+        lazy = lazy_path('admin/profiles/', 'recipes.profiling_urls', 'profiling')
+        self.assertEqual(resolve('/admin/profiles/', urlconf=self.make_urlconf(lazy)).view_name, 'profiling:profile_list')
+        self.assertTrue(lazy.urlconf_module.loaded)
+
+    def test_lazy_path_checks_app_name(self):
+        urlconf = self.make_urlconf(lazy_path('api/', 'recipes.api_urls', 'recipes_api'))
+        with self.assertRaises(ImproperlyConfigured):
+            reverse('recipes_api:recipe-list', urlconf=urlconf)
+
+    def test_project_urls_reverse_through_lazy_urlconfs(self):
+        self.assertEqual(reverse('api:recipe-list'), '/api/recipes/')
+        self.assertEqual(reverse('admin:recipes_recipe_changelist'), '/admin/recipes/recipe/')
+        self.assertEqual(reverse('profiling:profile_list'), '/admin/profiles/')
+        self.assertEqual(self.client.get('/api/recipes/').status_code, 200)
+
+    def test_warm_up_compiles_templates_and_resolves_paths(self):
+        with override_settings(
+            FAST_BOOT_WARM_TEMPLATES=['recipes/recipe_list.html', 'recipes/missing.html'],
+            FAST_BOOT_WARM_PATHS=['/recipes/', '/recipes/1/', '/no-such-page/'],
+        ):
+            warmed = warm_up()
+        self.assertEqual(warmed, {'templates': ['recipes/recipe_list.html'], 'paths': ['/recipes/', '/recipes/1/']})
+
+    def test_startup_profile_reports_imports_per_phase(self):
+        out = StringIO()
+        # The root redirect doesn't touch the database, so the fresh process needs none.
+        # ALLOWED_HOSTS is only patched for 'testserver' in this process.
+        call_command('startup_profile', '--fast-boot', '--path', '/', '--host', '127.0.0.1', '--json', stdout=out)
+        report = json.loads(out.getvalue())
+        self.assertTrue(report['fast_boot'])
+        self.assertEqual([(r['attempt'], r['status']) for r in report['requests']], [('cold', 302), ('warm', 302)])
+        self.assertGreater(report['time_to_first_response_ms'], report['boot_ms'])
+        boot_modules = {module['module'] for module in report['imports']['boot']}
+        self.assertIn('recipes.views', boot_modules)  # Imported by warm_up()
+        self.assertNotIn('django.test', boot_modules)
+        imported = {module['module'] for modules in report['imports'].values() for module in modules}
+        self.assertNotIn('rest_framework.routers', imported)
+        self.assertNotIn('recipes.admin', imported)
+
+        with self.assertRaisesMessage(CommandError, 'Startup budget exceeded'):
+            call_command(
+                'startup_profile', '--path', '/', '--host', '127.0.0.1', '--max-boot-ms', '0', stdout=StringIO()
+            )
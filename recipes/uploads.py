@@ -0,0 +1,202 @@
+# recipes/uploads.py
+"""
+Helpers for the resumable chunked image upload API (see ImageUploadViewSet).
+
+Chunks are streamed from the request straight into a temporary ".part" file
+in fixed-size pieces, so memory use per upload does not depend on the size of
+the image. Finalizing validates the image from its header (plus a reduced
+JPEG draft decode) instead of decoding the full-size picture.
+
+Writing a chunk and finalizing hold an exclusive lock on the upload's
+".lock" file, so two requests for the same upload (e.g. a client retrying
+after a timeout while its first attempt is still being received) never
+write into the ".part" file at the same time. The lock is taken without
+waiting, and the OS drops it if the worker dies, so it never goes stale.
+"""
+import os
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.utils import timezone
+from PIL import Image
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Size of the pieces copied from the request body to disk
+CHUNK_COPY_SIZE = 64 * 1024
+
+ALLOWED_IMAGE_FORMATS = ('JPEG', 'PNG', 'GIF', 'WEBP')
+
+
+def get_upload_temp_dir():
+    """
+    Returns (and creates) the directory where in-progress uploads are kept.
+    """
+    path = Path(getattr(settings, 'CHUNKED_UPLOAD_TEMP_DIR', Path(settings.BASE_DIR) / 'upload_tmp'))
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def get_max_upload_size():
+    return getattr(settings, 'CHUNKED_UPLOAD_MAX_SIZE', 50 * 1024 * 1024)
+
+
+def get_upload_expiry():
+    """
+    Seconds after its last chunk that an unfinished upload is purged.
+    """
+    return getattr(settings, 'CHUNKED_UPLOAD_EXPIRY', 24 * 60 * 60)
+
+
+class UploadLocked(Exception):
+    """
+    Another request is currently writing to or finalizing the same upload.
+    """
+
+
+@contextmanager
+def upload_lock(path):
+    """
+    Holds the exclusive lock of the upload whose ".part" file is `path`.
+    Raises UploadLocked at once if another request holds it.
+    """
+    fd = os.open(f'{path}.lock', os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        except OSError:
+            raise UploadLocked
+        try:
+            yield
+        finally:
+            if fcntl is None:
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+    finally:
+        os.close(fd)
+
+
+def discard_upload(upload):
+    """
+    Removes an upload session with its partial file and lock file.
+    """
+    try:
+        os.remove(upload.temp_path)
+    except FileNotFoundError:
+        pass
+    try:
+        os.remove(f'{upload.temp_path}.lock')
+    except OSError:
+        pass  # Windows can't remove it while it is held; purge_expired_uploads() does later
+    upload.delete()
+
+
+def purge_expired_uploads(max_age=None, dry_run=False):
+    """
+    Discards uploads whose last chunk arrived more than `max_age` seconds ago
+    (default: CHUNKED_UPLOAD_EXPIRY), then removes files in the temp directory
+    that are that old and belong to no upload. Returns (uploads, files) counts.
+    """
+    from .models import RecipeImageUpload
+    max_age = get_upload_expiry() if max_age is None else max_age
+    cutoff = timezone.now() - timezone.timedelta(seconds=max_age)
+
+    uploads = 0
+    for upload in RecipeImageUpload.objects.filter(updated_at__lt=cutoff):
+        if not dry_run:
+            try:
+                with upload_lock(upload.temp_path):
+                    discard_upload(upload)
+            except UploadLocked:
+                continue  # A chunk is arriving right now
+        uploads += 1
+
+    live = {str(pk) for pk in RecipeImageUpload.objects.values_list('pk', flat=True)}
+    file_cutoff = time.time() - max_age
+    files = 0
+    for entry in os.scandir(get_upload_temp_dir()):
+        upload_id = entry.name.split('.', 1)[0]
+        if upload_id in live or not entry.is_file() or entry.stat().st_mtime > file_cutoff:
+            continue
+        if not dry_run:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+        files += 1
+    return uploads, files
+
+
+def write_chunk(stream, path, offset, length):
+    """
+    Copies `length` bytes from a file-like stream into the file at `path`,
+    starting at `offset`. Returns the number of bytes actually written, which
+    is less than `length` if the client disconnected early. The caller must
+    hold the upload's upload_lock().
+    """
+    written = 0
+    mode = 'r+b' if os.path.exists(path) else 'wb'
+    with open(path, mode) as f:
+        f.seek(offset)
+        while written < length:
+            data = stream.read(min(CHUNK_COPY_SIZE, length - written))
+            if not data:
+                break
+            f.write(data)
+            written += len(data)
+        # Anything past the new end was written by an abandoned attempt
+        f.truncate(offset + written)
+    return written
+
+
+def validate_image_file(path):
+    """
+    Cheap validation of an uploaded image.
+
+    Pillow only parses the header on open(), which gives us the format and
+    dimensions. For JPEGs, draft() asks the decoder for a heavily downscaled
+    version, so load() exercises the compressed data at a fraction of the cost
+    of a full decode. Raises ValidationError if the file is not an acceptable image.
+    Returns the detected format name.
+    """
+    try:
+        with Image.open(path) as img:
+            if img.format not in ALLOWED_IMAGE_FORMATS:
+                raise ValidationError(f'Unsupported image format: {img.format}.')
+            width, height = img.size
+            if not width or not height:
+                raise ValidationError('Image has no dimensions.')
+            if img.draft(img.mode, (64, 64)) is not None:
+                img.load()
+            return img.format
+    except ValidationError:
+        raise
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError) as exc:
+        raise ValidationError(f'Upload is not a valid image: {exc}')
+
+
+class ChunkedUploadFile(File):
+    """
+    A File backed by the assembled ".part" file on disk.
+
+    Exposing temporary_file_path() lets FileSystemStorage move the file into
+    place instead of copying it, exactly as it does for Django's own
+    TemporaryUploadedFile.
+    """
+    def __init__(self, path, name):
+        super().__init__(open(path, 'rb'), name=name)
+        self.path = str(path)
+
+    def temporary_file_path(self):
+        return self.path
@@ -1,15 +1,16 @@
 # recipes/urls.py
 from django.urls import path
 from . import views
+from .static_render import serve_prerendered
 
 app_name = 'recipes'
 
 urlpatterns = [
-    # Recipe List
-    path('', views.RecipeListView.as_view(), name='recipe_list'),
+    # Recipe List (served from the pre-rendered files when STATIC_RENDER_SERVE is on)
+    path('', serve_prerendered(views.RecipeListView.as_view()), name='recipe_list'),
 
     # Recipe Detail
-    path('<int:pk>/', views.RecipeDetailView.as_view(), name='recipe_detail'),
+    path('<int:pk>/', serve_prerendered(views.RecipeDetailView.as_view()), name='recipe_detail'),
 
     # Add New Recipe
     path('add/', views.RecipeCreateView.as_view(), name='recipe_create'),
@@ -1,10 +1,40 @@
 # recipes/views.py
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
 from django.urls import reverse_lazy
+from django.db import IntegrityError
 from django.db.models import Q # Import Q object for complex lookups
+from django.http import HttpResponseRedirect
 
 from .models import Recipe
 from .forms import RecipeForm
+from .sharding import route_to_shard
+from .write_coalescer import run_write
+
+DUPLICATE_TITLE_MESSAGE = 'Recipe with this Title already exists.'
+
+class CoalescedWriteMixin:
+    """
+    Saves the form through run_write(), so concurrent saves are group-committed
+    when WRITE_COALESCING is enabled.
+    """
+
+    def form_valid(self, form):
+        try:
+            self.object = run_write(form.save)
+        except IntegrityError:
+            # Another request saved the same title between validation and commit
+            form.add_error('title', DUPLICATE_TITLE_MESSAGE)
+            return self.form_invalid(form)
+        return HttpResponseRedirect(self.get_success_url())
+
+class ShardRoutedObjectMixin:
+    """
+    Looks the recipe up on its owning shard only (when RECIPE_SHARDS is set)
+    instead of querying every shard.
+    """
+
+    def get_queryset(self):
+        return route_to_shard(super().get_queryset(), self.kwargs.get(self.pk_url_kwarg))
 
 class RecipeListView(ListView):
     """
@@ -43,12 +73,12 @@ class RecipeListView(ListView):
 
 # ... (RecipeDetailView, RecipeCreateView, RecipeUpdateView, RecipeDeleteView remain unchanged)
 
-class RecipeDetailView(DetailView):
+class RecipeDetailView(ShardRoutedObjectMixin, DetailView):
     model = Recipe
     template_name = 'recipes/recipe_detail.html'
     context_object_name = 'recipe'
 
-class RecipeCreateView(CreateView):
+class RecipeCreateView(CoalescedWriteMixin, CreateView):
     """
     Handles the creation of a new recipe.
     Uses RecipeForm for form validation and rendering.
@@ -64,7 +94,7 @@ class RecipeCreateView(CreateView):
         """
         return reverse_lazy('recipes:recipe_detail', kwargs={'pk': self.object.pk})
 
-class RecipeUpdateView(UpdateView):
+class RecipeUpdateView(ShardRoutedObjectMixin, CoalescedWriteMixin, UpdateView):
     """
     Handles the updating of an existing recipe.
     Uses RecipeForm for form validation and rendering.
@@ -81,11 +111,19 @@ class RecipeUpdateView(UpdateView):
         """
         return reverse_lazy('recipes:recipe_detail', kwargs={'pk': self.object.pk})
 
-class RecipeDeleteView(DeleteView):
+class RecipeDeleteView(ShardRoutedObjectMixin, DeleteView):
     """
     Handles the deletion of a recipe.
     """
     model = Recipe
     template_name = 'recipes/recipe_confirm_delete.html' # Template to confirm deletion
     context_object_name = 'recipe' # The object to be deleted will be available as 'recipe'
-    success_url = reverse_lazy('recipes:recipe_list') # Redirect to list after deletion
\ No newline at end of file
+    success_url = reverse_lazy('recipes:recipe_list') # Redirect to list after deletion
+
+    def form_valid(self, form):
+        """
+        Deletes through run_write() (group commit when WRITE_COALESCING is enabled).
+        """
+        success_url = self.get_success_url()
+        run_write(self.object.delete)
+        return HttpResponseRedirect(success_url)
\ No newline at end of file
@@ -0,0 +1,173 @@
+# recipes/write_coalescer.py
+"""
+Group commit for database writes.
+
+SQLite allows one writer at a time, so concurrent requests that each open
+their own write transaction queue up on the database lock (and eventually
+fail with "database is locked"). With WRITE_COALESCING enabled, writes are
+instead handed to a single writer thread per process, which runs everything
+that arrives within a short window in one transaction. Every write runs in
+its own savepoint, so one failing write (e.g. a duplicate title) is rolled
+back and reported to its caller without affecting the rest of the batch.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, connections, transaction
+
+from .sharding import is_sharding_enabled
+
+logger = logging.getLogger(__name__)
+
+
+class _WriteRequest:
+    __slots__ = ('func', 'args', 'kwargs', 'future')
+
+    def __init__(self, func, args, kwargs):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+
+
+class WriteCoalescer:
+    """
+    Runs submitted write callables on one background thread, committing them
+    in batches. `window` is how long (seconds) the writer waits for more
+    writes after the first one arrives; `max_batch` caps the batch size;
+    `timeout` is how long a caller waits for its batch to commit.
+    """
+
+    def __init__(self, window=0.005, max_batch=64, using='default', timeout=30):
+        self.window = window
+        self.max_batch = max_batch
+        self.using = using
+        self.timeout = timeout
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name='write-coalescer', daemon=True)
+        self._thread.start()
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Queues func(*args, **kwargs) and blocks until its batch has committed.
+        Returns func's result, or raises the exception it (or the commit) raised.
+
+        Raises DatabaseError if the batch has not committed within `timeout`
+        seconds; the write is then dropped if the writer has not started it yet,
+        otherwise its outcome is unknown.
+        """
+        request = _WriteRequest(func, args, kwargs)
+        self._queue.put(request)
+        try:
+            return request.future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            request.future.cancel()
+            raise DatabaseError(f'The write was not committed within {self.timeout} seconds.')
+
+    def _collect_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = []
+            try:
+                batch = self._collect_batch()
+                close_old_connections()
+                self._commit(batch)
+            except Exception as exc:
+                # Never let the writer thread die: every later write would wait for it
+                logger.exception('Write coalescer failed to process a batch.')
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_exception(exc)
+
+    def _commit(self, batch):
+        # Skip writes whose caller gave up waiting before they were started
+        batch = [request for request in batch if request.future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        outcomes = []
+        try:
+            with transaction.atomic(using=self.using):
+                for request in batch:
+                    try:
+                        with transaction.atomic(using=self.using):
+                            result = request.func(*request.args, **request.kwargs)
+                    except Exception as exc:
+                        outcomes.append((request, False, exc))
+                    else:
+                        outcomes.append((request, True, result))
+                if transaction.get_rollback(using=self.using):
+                    # A savepoint could not be rolled back cleanly, so the whole batch is lost
+                    raise DatabaseError('The write batch was rolled back.')
+        except Exception as exc:
+            # The batch as a whole failed to commit: nothing in it was written
+            for request in batch:
+                if not request.future.done():
+                    request.future.set_exception(exc)
+            connections[self.using].close()
+            return
+
+        # Only report results once they are durable
+        for request, succeeded, value in outcomes:
+            if succeeded:
+                request.future.set_result(value)
+            else:
+                request.future.set_exception(value)
+
+
+_coalescer = None
+_coalescer_pid = None
+_coalescer_lock = threading.Lock()
+
+
+def get_write_coalescer():
+    """
+    Returns this process's coalescer, creating it on first use (and again after a fork).
+    """
+    global _coalescer, _coalescer_pid
+    pid = os.getpid()
+    if _coalescer is None or _coalescer_pid != pid:
+        with _coalescer_lock:
+            if _coalescer is None or _coalescer_pid != pid:
+                _coalescer = WriteCoalescer(
+                    window=getattr(settings, 'WRITE_COALESCING_WINDOW', 0.005),
+                    max_batch=getattr(settings, 'WRITE_COALESCING_MAX_BATCH', 64),
+                    timeout=getattr(settings, 'WRITE_COALESCING_TIMEOUT', 30),
+                )
+                _coalescer_pid = pid
+    return _coalescer
+
+
+def run_write(func, *args, **kwargs):
+    """
+    Runs a database write, through the group-commit writer when
+    WRITE_COALESCING is enabled and directly otherwise.
+
+    Writes that are already inside a transaction always run inline, since
+    they have to commit (or roll back) together with the caller's work. So do
+    writes while recipes are sharded: the batch transaction only covers the
+    default database, not the shards the recipes are written to.
+    """
+    if (
+        not getattr(settings, 'WRITE_COALESCING', False)
+        or connections['default'].in_atomic_block
+        or is_sharding_enabled()
+    ):
+        return func(*args, **kwargs)
+    return get_write_coalescer().submit(func, *args, **kwargs)